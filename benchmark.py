@@ -0,0 +1,458 @@
+"""
+Benchmarks do gerador de relatórios.
+
+Subcomandos:
+    modelo    custo por linha de abrir/renderizar o modelo .docx: Document()
+              a cada linha x ModeloCompilado.clonar(), e os dois backends.
+    gerar     cria uma planilha sintética (datas bagunçadas como nas reais).
+    pipeline  roda preencher_relatorio sobre uma planilha (sintética ou
+              real), por padrão com MODELO RELATORIO.docx, e mostra linhas/s,
+              tempo por etapa e pico de memória da Instrumentacao da
+              execução; pode salvar o resultado como baseline e comparar
+              execuções com ele.
+    linhas    custo por linha fora da renderização (iterar, número do
+              processo, valores dos placeholders, impressão do modo
+              incremental): df.iterrows() x linhas_compactas().
+    datas     confere que resolver_datas_tabela (colunar) dá o mesmo que
+              resolver_datas linha a linha, incluindo anos fora do
+              intervalo do datetime64[ns] (antes de 1677, depois de 2262).
+    inicializacao
+              tempo de abertura do programa até a janela de seleção
+              (import v3 + typer + tkinter) em processos novos; falha se
+              passar do limite ou se o import já carregar módulos pesados.
+
+Uso:
+    python benchmark.py modelo -n 500 modelo.docx
+    python benchmark.py gerar --linhas 20000 sintetica.xlsx
+    python benchmark.py pipeline --linhas 2000 --backend xml --salvar-baseline base.json
+    python benchmark.py pipeline --linhas 2000 --backend xml --baseline base.json
+    python benchmark.py linhas --linhas 20000
+    python benchmark.py datas --linhas 5000
+    python benchmark.py inicializacao --limite-ms 500
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from docx import Document
+
+import instrumentacao
+from instrumentacao import pico_rss_mb
+from v3 import (BACKENDS, EVENTOS_SEQUENCIA_PRECA, EVENTOS_SEQUENCIA_RPV, MAPEAMENTO, ModeloCompilado,
+                impressao_linha, linhas_compactas, numero_do_processo, preencher_relatorio, preparar_planilha,
+                resolver_datas, resolver_datas_tabela, resource_path, valores_da_linha)
+
+
+def _medir(rotulo, fn, n):
+    inicio = time.perf_counter()
+    for _ in range(n):
+        fn()
+    total = time.perf_counter() - inicio
+    print(f"  {rotulo:<22} {total / n * 1000:8.2f} ms/linha   ({total:.2f}s em {n} linhas)")
+    return total / n
+
+
+def benchmark_modelo(caminho: str, n: int):
+    print(f"\n📄 {os.path.basename(caminho)}")
+
+    def antes():
+        Document(caminho).save(io.BytesIO())
+
+    modelo = ModeloCompilado(caminho)
+
+    def depois():
+        modelo.clonar().save(io.BytesIO())
+
+    t_antes = _medir("Document() por linha", antes, n)
+    t_depois = _medir("ModeloCompilado.clonar", depois, n)
+    print(f"  ganho: {t_antes / t_depois:.1f}x")
+
+    linha = {
+        'NUMERO_PROCESSO': '0001234-56.2020.8.26.0100', 'AUTOR': 'Fulano de Tal',
+        'DATA_ACAO': '10/03/2020', 'DATA_PERICIA': '2020-06-01', 'TIPO LAUDO': 'Positivo',
+    }
+    datas = resolver_datas(linha, EVENTOS_SEQUENCIA_PRECA)
+    for nome, classe in BACKENDS.items():
+        renderizador = classe(caminho)
+        _medir(f"render backend {nome}", lambda: renderizador.renderizar(linha, datas), n)
+
+
+# --- Planilha sintética ---
+COLUNAS_DATA = [col for col in MAPEAMENTO if col.startswith('DATA_')]
+NOMES = ['Maria', 'José', 'Ana', 'João', 'Antônio', 'Francisca', 'Conceição', 'Sebastião']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Araújo', 'Gonçalves']
+TEXTOS = {
+    'TIPO LAUDO': ['Positivo', 'POSITIVO ', 'Parcialmente positivo', 'Negativo', 'negativo', '', None],
+    'SENTENCA': ['Procedente', 'Improcedente', 'Parcialmente procedente', '', None],
+    'APE': ['Autor', 'INSS', 'autor e INSS', '', None],
+    'JULGA': ['Favorável', 'Desfavorável', 'favoravel', '', None],
+    'CUMPRIMENTO_SENTENCA': ['Sim', 'Não', '', None],
+    'SITUACAO_PROCESSO': ['Em andamento', 'Arquivado', 'Aguardando pagamento', 'Suspenso'],
+}
+
+
+def _data_baguncada(rnd, dt: date):
+    """Uma data como aparece nas exportações reais: texto BR, ISO, data do Excel ou lixo."""
+    formato = rnd.random()
+    if formato < 0.45:
+        return dt.strftime('%d/%m/%Y')
+    if formato < 0.6:
+        return dt.isoformat()
+    if formato < 0.9:
+        return datetime(dt.year, dt.month, dt.day)
+    return rnd.choice(['', 'None', None])
+
+
+def gerar_planilha_sintetica(caminho: str, linhas: int, semente: int = 42):
+    """Cria um .xlsx com `linhas` processos e o mesmo layout de colunas do Conformidade.xlsx."""
+    from openpyxl import Workbook
+    rnd = random.Random(semente)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    colunas = list(MAPEAMENTO)
+    ws.append(colunas)
+    for i in range(linhas):
+        inicio = date(2015, 1, 1) + timedelta(days=rnd.randint(0, 3000))
+        preenchidas = rnd.randint(0, len(COLUNAS_DATA))  # processos em fases diferentes
+        linha = {}
+        for j, col in enumerate(COLUNAS_DATA):
+            if j < preenchidas:
+                linha[col] = _data_baguncada(rnd, inicio + timedelta(days=45 * j + rnd.randint(0, 30)))
+        if rnd.random() < 0.05:
+            numero = float(rnd.randint(100000, 999999))  # o Excel às vezes vira número
+        else:
+            numero = f'{rnd.randint(0, 9999999):07d}-{rnd.randint(10, 99)}.{inicio.year}.8.26.{rnd.randint(1, 999):04d}'
+        linha['NUMERO_PROCESSO'] = numero
+        linha['AUTOR'] = f'{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {rnd.choice(SOBRENOMES)}'
+        for col, opcoes in TEXTOS.items():
+            linha[col] = rnd.choice(opcoes)
+        ws.append([linha.get(col) for col in colunas])
+    wb.save(caminho)
+
+
+# --- Pipeline completo ---
+def benchmark_pipeline(planilha: str, modelo_preca: str, modelo_rpv: str, backend: str, streaming: bool,
+                       workers: int = 1):
+    """Roda preencher_relatorio numa pasta temporária e resume a Instrumentacao da execução."""
+    medicao = instrumentacao.Instrumentacao()
+    inicio = time.perf_counter()
+    with tempfile.TemporaryDirectory() as pasta:
+        ok = preencher_relatorio(planilha, modelo_preca, modelo_rpv, pasta, workers=workers, streaming=streaming,
+                                 backend=backend, cache_planilha=False, medicao=medicao)
+    total = time.perf_counter() - inicio
+    if not ok:
+        raise SystemExit("✗ preencher_relatorio não executou (veja as mensagens acima)")
+    dados = medicao.relatorio()
+    return {
+        'planilha': os.path.basename(planilha),
+        'backend': backend,
+        'streaming': streaming,
+        'workers': workers,
+        'linhas': dados['linhas'],
+        'relatorios': dados['relatorios'],
+        'erros': dados['erros'],
+        'total_s': round(total, 4),
+        'linhas_por_segundo': round(dados['linhas'] / total, 2) if total else None,
+        'etapas_s': {nome: etapa['total_s'] for nome, etapa in dados['etapas'].items()},
+        'pico_memoria_mb': pico_rss_mb(),
+        'pico_memoria_workers_mb': dados['pico_rss_workers_mb'],
+    }
+
+
+def benchmark_linhas(planilha: str, repeticoes: int = 3):
+    """
+    O que o loop faz por linha além de renderizar/gravar, com a preparação
+    colunar já feita (datas, checkboxes e textos): percorrer a linha
+    (iterar + numero_do_processo) e o total com valores_da_linha e
+    impressao_linha. Vale o melhor de
+    `repeticoes` passadas, em µs/linha.
+    """
+    import pandas as pd
+    df = pd.read_excel(planilha)
+    preparados = preparar_planilha(df)
+
+    def percorrer(linhas):
+        for index, row in linhas:
+            numero_do_processo(index, row)
+
+    def completo(linhas):
+        for (index, row), preparado in zip(linhas, preparados):
+            numero_do_processo(index, row)
+            valores_da_linha(row, preparado['datas']['PRECA'], preparado['textos'])
+            impressao_linha(row)
+
+    def medir(fn, linhas):
+        melhor = float('inf')
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            fn(linhas())
+            melhor = min(melhor, time.perf_counter() - inicio)
+        return round(melhor / max(len(df), 1) * 1e6, 1)
+
+    resultado = {'planilha': os.path.basename(planilha), 'linhas': len(df)}
+    for nome, linhas in (('iterrows', lambda: df.iterrows()), ('compactas', lambda: linhas_compactas(df))):
+        resultado[nome] = {'percorrer_us': medir(percorrer, linhas), 'total_us': medir(completo, linhas)}
+    return resultado
+
+
+# --- Equivalência das datas ---
+# Linhas extras com anos que não cabem em datetime64[ns], em todos os formatos
+_DATAS_EXTREMAS = [
+    '01/05/3020', '3020-05-01', datetime(3020, 5, 1),
+    '15/08/1500', '1500-08-15', datetime(1500, 8, 15),
+    '31/12/2262', datetime(1677, 9, 21),
+]
+
+
+def verificar_datas(planilha: str):
+    """Linhas em que resolver_datas_tabela diverge de resolver_datas: [(linha, tipo, coluna, linha, colunar)]."""
+    import pandas as pd
+    df = pd.read_excel(planilha)
+    colunas = [col for col, _, _, _ in EVENTOS_SEQUENCIA_PRECA + EVENTOS_SEQUENCIA_RPV]
+    extras = pd.DataFrame({col: [None] * len(_DATAS_EXTREMAS) for col in df.columns}, dtype=object)
+    for i, valor in enumerate(_DATAS_EXTREMAS):
+        extras.at[i, colunas[i % len(colunas)]] = valor
+    df = pd.concat([df.astype(object), extras], ignore_index=True)
+    divergencias = []
+    for tipo, sequencia in (('PRECA', EVENTOS_SEQUENCIA_PRECA), ('RPV', EVENTOS_SEQUENCIA_RPV)):
+        colunar = resolver_datas_tabela(df, sequencia)
+        for (index, row), datas in zip(df.iterrows(), colunar):
+            esperado = resolver_datas(row, sequencia)
+            for col in esperado:
+                if esperado[col] != datas[col]:
+                    divergencias.append((index, tipo, col, esperado[col], datas[col]))
+    return len(df), divergencias
+
+
+def _imprimir_resultado(resultado):
+    print(f"\n⏱  {resultado['linhas']} linhas, {resultado['relatorios']} relatórios, "
+          f"{resultado['erros']} erros em {resultado['total_s']:.2f}s "
+          f"({resultado['linhas_por_segundo']} linhas/s)")
+    for nome, t in resultado['etapas_s'].items():
+        print(f"  {nome:<24} {t:8.3f}s")
+    if resultado['pico_memoria_mb'] is not None:
+        print(f"  pico de memória: {resultado['pico_memoria_mb']:.0f} MB")
+    if resultado.get('pico_memoria_workers_mb') is not None:
+        print(f"  pico por worker: {resultado['pico_memoria_workers_mb']:.0f} MB")
+
+
+def comparar_com_baseline(resultado, baseline, tolerancia: float) -> bool:
+    """Mostra a variação de cada métrica; devolve False se alguma piorou além da tolerância."""
+    ok = True
+    metricas = [('linhas_por_segundo', resultado['linhas_por_segundo'], baseline.get('linhas_por_segundo'), True),
+                ('pico_memoria_mb', resultado['pico_memoria_mb'], baseline.get('pico_memoria_mb'), False)]
+    for nome, t in resultado['etapas_s'].items():
+        metricas.append((f'etapa {nome}', t, baseline.get('etapas_s', {}).get(nome), False))
+    print("\n📊 Comparação com a baseline")
+    for nome, atual, anterior, maior_melhor in metricas:
+        if not atual or not anterior:
+            continue
+        variacao = (atual - anterior) / anterior
+        piorou = -variacao > tolerancia if maior_melhor else variacao > tolerancia
+        # etapas muito curtas oscilam demais para servir de alerta
+        if piorou and not maior_melhor and nome.startswith('etapa') and anterior < 0.05:
+            piorou = False
+        marca = '✗' if piorou else '✓'
+        print(f"  {marca} {nome:<22} {anterior:10.3f} -> {atual:10.3f} ({variacao:+.1%})")
+        ok = ok and not piorou
+    return ok
+
+
+# Só devem ser carregados quando a etapa que precisa deles roda (não no import do v3)
+MODULOS_PESADOS = ('pandas', 'numpy', 'docx', 'openpyxl', 'dateutil', 'lxml')
+
+# Roda num processo novo: mede cada passo até a janela de seleção aparecer
+_SCRIPT_INICIALIZACAO = '''
+import json, sys, time
+t0 = time.perf_counter()
+import v3
+t1 = time.perf_counter()
+carregados = [m for m in %r if m in sys.modules]
+import typer
+t2 = time.perf_counter()
+try:
+    from tkinter import Tk, filedialog
+    t3 = time.perf_counter()
+except ImportError:
+    t3 = None
+print(json.dumps({'v3': t1 - t0, 'typer': t2 - t1, 'tkinter': None if t3 is None else t3 - t2,
+                  'carregados': carregados}))
+''' % (MODULOS_PESADOS,)
+
+
+def _maiores_imports(stderr: str, quantos: int = 8):
+    # Linhas do -X importtime: "import time: self [us] | cumulative | nome"
+    tempos = {}
+    for linha in stderr.splitlines():
+        partes = linha.split('|')
+        if len(partes) != 3 or not linha.startswith('import time:'):
+            continue
+        try:
+            cumulativo = int(partes[1])
+        except ValueError:
+            continue
+        nome = partes[2].strip()
+        if '.' not in nome:  # só os de topo, senão o pacote aparece repetido
+            tempos[nome] = cumulativo / 1000
+    return sorted(tempos.items(), key=lambda kv: -kv[1])[:quantos]
+
+
+def benchmark_inicializacao(repeticoes: int = 5):
+    """Mede, em processos novos, o tempo de import do v3 até a janela de seleção."""
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    medidas, maiores = [], []
+    for i in range(repeticoes):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _SCRIPT_INICIALIZACAO],
+                              cwd=pasta, capture_output=True, text=True, check=True)
+        medidas.append(json.loads(proc.stdout))
+        if i == 0:
+            maiores = _maiores_imports(proc.stderr)
+
+    def _mediana_ms(chave):
+        valores = [m[chave] for m in medidas if m[chave] is not None]
+        return round(statistics.median(valores) * 1000, 1) if valores else None
+
+    etapas = {chave: _mediana_ms(chave) for chave in ('v3', 'typer', 'tkinter')}
+    return {
+        'repeticoes': repeticoes,
+        'etapas_ms': etapas,
+        'total_ms': round(sum(v for v in etapas.values() if v), 1),
+        'pesados_no_import': medidas[0]['carregados'],
+        'maiores_imports_ms': dict(maiores),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do gerador de relatórios.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_modelo = sub.add_parser("modelo", help="custo por linha de abrir/renderizar o modelo")
+    p_modelo.add_argument("modelos", nargs="*", help="modelos .docx (padrão: MODELO RELATORIO.docx)")
+    p_modelo.add_argument("-n", type=int, default=200, help="linhas simuladas por modelo")
+
+    p_gerar = sub.add_parser("gerar", help="cria uma planilha sintética")
+    p_gerar.add_argument("saida", help="caminho do .xlsx a criar")
+    p_gerar.add_argument("--linhas", type=int, default=1000)
+    p_gerar.add_argument("--semente", type=int, default=42)
+
+    p_pipe = sub.add_parser("pipeline", help="pipeline completo com tempo por etapa")
+    p_pipe.add_argument("--planilha", help="planilha a usar (padrão: sintética com --linhas)")
+    p_pipe.add_argument("--linhas", type=int, default=1000, help="tamanho da planilha sintética")
+    p_pipe.add_argument("--semente", type=int, default=42)
+    p_pipe.add_argument("--modelo-preca", help="padrão: MODELO RELATORIO.docx")
+    p_pipe.add_argument("--modelo-rpv", help="padrão: MODELO RELATORIO.docx")
+    p_pipe.add_argument("--backend", choices=sorted(BACKENDS), default="docx")
+    p_pipe.add_argument("--streaming", action="store_true")
+    p_pipe.add_argument("--workers", type=int, default=1)
+    p_pipe.add_argument("--json", help="grava o resultado neste arquivo JSON")
+    p_pipe.add_argument("--salvar-baseline", help="grava o resultado como baseline neste JSON")
+    p_pipe.add_argument("--baseline", help="compara com uma baseline salva (sai com código 1 se piorar)")
+    p_pipe.add_argument("--tolerancia", type=float, default=0.10, help="piora aceita (padrão: 0.10 = 10%%)")
+
+    p_linhas = sub.add_parser("linhas", help="custo por linha fora da renderização")
+    p_linhas.add_argument("--planilha", help="planilha a usar (padrão: sintética com --linhas)")
+    p_linhas.add_argument("--linhas", type=int, default=5000, help="tamanho da planilha sintética")
+    p_linhas.add_argument("--semente", type=int, default=42)
+    p_linhas.add_argument("-n", type=int, default=3, help="passadas (vale a mais rápida)")
+    p_linhas.add_argument("--json", help="grava o resultado neste arquivo JSON")
+
+    p_datas = sub.add_parser("datas", help="confere a resolução colunar de datas com a linha a linha")
+    p_datas.add_argument("--planilha", help="planilha a usar (padrão: sintética com --linhas)")
+    p_datas.add_argument("--linhas", type=int, default=2000, help="tamanho da planilha sintética")
+    p_datas.add_argument("--semente", type=int, default=42)
+
+    p_inicio = sub.add_parser("inicializacao", help="tempo até a janela de seleção (imports)")
+    p_inicio.add_argument("-n", type=int, default=5, help="processos novos a medir (vale a mediana)")
+    p_inicio.add_argument("--limite-ms", type=float, default=1000,
+                          help="sai com código 1 se o total passar disso (padrão: 1000)")
+    p_inicio.add_argument("--json", help="grava o resultado neste arquivo JSON")
+
+    args = parser.parse_args()
+
+    if args.comando == "modelo":
+        for caminho in args.modelos or [resource_path("MODELO RELATORIO.docx")]:
+            benchmark_modelo(caminho, args.n)
+
+    elif args.comando == "gerar":
+        gerar_planilha_sintetica(args.saida, args.linhas, args.semente)
+        print(f"Planilha sintética com {args.linhas} linhas: {args.saida}")
+
+    elif args.comando == "linhas":
+        with tempfile.TemporaryDirectory() as tmp:
+            planilha = args.planilha
+            if not planilha:
+                planilha = os.path.join(tmp, f'sintetica_{args.linhas}.xlsx')
+                gerar_planilha_sintetica(planilha, args.linhas, args.semente)
+            resultado = benchmark_linhas(planilha, args.n)
+        print(f"\n⏱  {resultado['linhas']} linhas, µs/linha fora da renderização:")
+        print(f"  {'':<20} {'percorrer':>10} {'total':>10}")
+        for nome, rotulo in (('iterrows', 'df.iterrows()'), ('compactas', 'linhas_compactas()')):
+            print(f"  {rotulo:<20} {resultado[nome]['percorrer_us']:10.1f} {resultado[nome]['total_us']:10.1f}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    elif args.comando == "datas":
+        with tempfile.TemporaryDirectory() as tmp:
+            planilha = args.planilha
+            if not planilha:
+                planilha = os.path.join(tmp, f'sintetica_{args.linhas}.xlsx')
+                gerar_planilha_sintetica(planilha, args.linhas, args.semente)
+            linhas, divergencias = verificar_datas(planilha)
+        for index, tipo, col, esperado, colunar in divergencias[:20]:
+            print(f"✗ linha {index} {tipo} {col}: linha a linha {esperado} x colunar {colunar}")
+        if divergencias:
+            print(f"✗ {len(divergencias)} divergências em {linhas} linhas")
+            sys.exit(1)
+        print(f"✓ {linhas} linhas: resolução colunar igual à linha a linha")
+
+    elif args.comando == "inicializacao":
+        resultado = benchmark_inicializacao(args.n)
+        print(f"\n⏱  Até a janela de seleção: {resultado['total_ms']} ms (mediana de {args.n})")
+        for nome, ms in resultado['etapas_ms'].items():
+            print(f"  import {nome:<10} {'indisponível' if ms is None else f'{ms:8.1f} ms'}")
+        print("  maiores imports (1ª execução):")
+        for nome, ms in resultado['maiores_imports_ms'].items():
+            print(f"    {nome:<24} {ms:8.1f} ms")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(resultado, f, ensure_ascii=False, indent=2)
+        ok = True
+        if resultado['pesados_no_import']:
+            print(f"✗ import v3 carregou módulos pesados: {', '.join(resultado['pesados_no_import'])}")
+            ok = False
+        if resultado['total_ms'] > args.limite_ms:
+            print(f"✗ acima do limite de {args.limite_ms:.0f} ms")
+            ok = False
+        if not ok:
+            sys.exit(1)
+
+    else:
+        modelo_preca = args.modelo_preca or resource_path("MODELO RELATORIO.docx")
+        modelo_rpv = args.modelo_rpv or resource_path("MODELO RELATORIO.docx")
+        with tempfile.TemporaryDirectory() as tmp:
+            planilha = args.planilha
+            if not planilha:
+                planilha = os.path.join(tmp, f'sintetica_{args.linhas}.xlsx')
+                gerar_planilha_sintetica(planilha, args.linhas, args.semente)
+            resultado = benchmark_pipeline(planilha, modelo_preca, modelo_rpv, args.backend, args.streaming,
+                                           args.workers)
+        _imprimir_resultado(resultado)
+
+        for destino in (args.json, args.salvar_baseline):
+            if destino:
+                with open(destino, 'w', encoding='utf-8') as f:
+                    json.dump(resultado, f, ensure_ascii=False, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            if not comparar_com_baseline(resultado, baseline, args.tolerancia):
+                sys.exit(1)
@@ -0,0 +1,196 @@
+"""
+Instrumentação das etapas do gerador de relatórios.
+
+Uma Instrumentacao ativa por processo acumula o tempo de cada etapa
+(`with etapa('leitura'): ...`), a latência de cada linha e os erros, e no
+fim gera um relatório JSON da execução (totais, p50/p95/p99, linhas mais
+lentas, pico de memória). Sem instrumentação ativa, etapa() não faz nada.
+Nos workers do modo paralelo cada processo tem a sua; os tempos voltam
+junto com o resultado de cada linha e são somados no processo principal.
+"""
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_atual = None
+
+
+def _contadores_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class _Contadores(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    contadores = _Contadores()
+    contadores.cb = ctypes.sizeof(contadores)
+    processo = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(processo, ctypes.byref(contadores), contadores.cb):
+        return contadores
+    return None
+
+
+def pico_rss_mb():
+    """Pico de memória residente deste processo, em MB (None se não der para medir)."""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024, 1)
+    except ImportError:
+        pass
+    try:  # Windows
+        contadores = _contadores_windows()
+        if contadores is not None:
+            return round(contadores.PeakWorkingSetSize / (1024 * 1024), 1)
+    except Exception:
+        pass
+    return None
+
+
+def rss_atual_mb():
+    """Memória residente deste processo agora, em MB (None se não der para medir)."""
+    try:  # Linux
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return round(paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:  # Windows
+        contadores = _contadores_windows()
+        if contadores is not None:
+            return round(contadores.WorkingSetSize / (1024 * 1024), 1)
+    except Exception:
+        pass
+    return None
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    k = max(0, math.ceil(p / 100 * len(ordenados)) - 1)  # nearest-rank
+    return round(ordenados[k], 2)
+
+
+class Instrumentacao:
+    MAIS_LENTAS = 10
+
+    def __init__(self):
+        self.inicio = datetime.now()
+        self._t0 = time.perf_counter()
+        self.etapas = {}    # nome -> [segundos, chamadas]
+        self.linhas = []    # (segundos, index, numero_processo)
+        self.relatorios = 0
+        self.erros = 0
+        self.pico_workers_mb = None
+        self.extras = {}    # seções adicionais do relatório (ex.: cache de datas)
+        self._trava = threading.Lock()  # etapas também são somadas pelas threads de gravação
+
+    def somar(self, nome, segundos, chamadas=1):
+        with self._trava:
+            acumulado = self.etapas.setdefault(nome, [0.0, 0])
+            acumulado[0] += segundos
+            acumulado[1] += chamadas
+
+    def mesclar_etapas(self, etapas: dict):
+        for nome, (segundos, chamadas) in etapas.items():
+            self.somar(nome, segundos, chamadas)
+
+    def extrair_etapas(self) -> dict:
+        """Devolve e zera os tempos acumulados (usado pelos workers a cada linha)."""
+        with self._trava:
+            etapas, self.etapas = self.etapas, {}
+        return etapas
+
+    def registrar_linha(self, index, numero_processo, segundos, relatorios, erros):
+        self.linhas.append((segundos, index, numero_processo))
+        self.relatorios += relatorios
+        self.erros += erros
+
+    def incorporar(self, outra):
+        """Soma outra medição a esta: etapas, linhas e pico dos workers (modo lote: uma por planilha)."""
+        self.mesclar_etapas(outra.etapas)
+        self.linhas.extend(outra.linhas)
+        self.relatorios += outra.relatorios
+        self.erros += outra.erros
+        self.registrar_pico_worker(outra.pico_workers_mb)
+
+    def registrar_falhas_gravacao(self, quantidade):
+        # o relatório já tinha sido contado como gerado quando entrou na fila
+        self.relatorios -= quantidade
+        self.erros += quantidade
+
+    def registrar_pico_worker(self, pico_mb):
+        if pico_mb is not None:
+            self.pico_workers_mb = max(self.pico_workers_mb or 0, pico_mb)
+
+    def relatorio(self, **contexto) -> dict:
+        duracao = time.perf_counter() - self._t0
+        latencias = sorted(s * 1000 for s, _, _ in self.linhas)
+        mais_lentas = sorted(self.linhas, key=lambda t: t[0], reverse=True)[:self.MAIS_LENTAS]
+        return {
+            **contexto,
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'duracao_s': round(duracao, 3),
+            'linhas': len(self.linhas),
+            'relatorios': self.relatorios,
+            'erros': self.erros,
+            'linhas_por_segundo': round(len(self.linhas) / duracao, 2) if duracao else None,
+            'etapas': {nome: {'total_s': round(s, 4), 'chamadas': n}
+                       for nome, (s, n) in sorted(self.etapas.items(), key=lambda kv: -kv[1][0])},
+            'latencia_linha_ms': {
+                'p50': _percentil(latencias, 50), 'p95': _percentil(latencias, 95),
+                'p99': _percentil(latencias, 99), 'max': round(latencias[-1], 2) if latencias else None,
+                'media': round(sum(latencias) / len(latencias), 2) if latencias else None,
+            },
+            'linhas_mais_lentas': [{'linha': index + 1, 'numero_processo': numero, 'ms': round(s * 1000, 2)}
+                                   for s, index, numero in mais_lentas],
+            'pico_rss_mb': pico_rss_mb(),
+            'pico_rss_workers_mb': self.pico_workers_mb,
+            **self.extras,
+        }
+
+    def salvar(self, caminho, **contexto) -> dict:
+        dados = self.relatorio(**contexto)
+        temporario = caminho + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(temporario, caminho)
+        return dados
+
+
+def ativar(instrumentacao=None) -> Instrumentacao:
+    global _atual
+    _atual = instrumentacao or Instrumentacao()
+    return _atual
+
+
+def desativar():
+    global _atual
+    _atual = None
+
+
+def atual():
+    return _atual
+
+
+@contextmanager
+def etapa(nome):
+    instrumentacao = _atual
+    if instrumentacao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        instrumentacao.somar(nome, time.perf_counter() - inicio)
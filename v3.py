@@ -1,12 +1,35 @@
-import pandas as pd
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.oxml.ns import qn
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
+from __future__ import annotations
+
+# pandas, numpy, python-docx, openpyxl e dateutil são importados dentro das
+# funções que os usam: abrir o programa (e a janela de seleção) não paga
+# pelos módulos pesados. `python benchmark.py inicializacao` vigia isso.
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING
+import copy
+import cProfile
+import csv
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import queue
 import re
+import zipfile
+import zlib
 import sys
+import threading
+import time
+import warnings
+
+import instrumentacao
+from instrumentacao import etapa
+
+if TYPE_CHECKING:
+    import numpy as np
 
 # --- Seletor de arquivos/pastas ---
 def escolher_arquivo_excel():
@@ -38,276 +61,2701 @@ def resource_path(rel_path: str) -> str:
     base = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base, rel_path)
 
-def preencher_relatorio(excel_path: str, modelo_preca_path: str, modelo_rpv_path: str, saida_dir: str):
+# --- Modelo .docx lido uma única vez ---
+class ModeloCompilado:
+    """
+    Abre e interpreta o .docx do modelo uma única vez e guarda a árvore XML
+    original em memória. A cada linha, clonar() devolve um Document com uma
+    cópia nova do corpo, sem reabrir o zip nem reinterpretar o XML.
+    As demais partes (estilos, cabeçalho, imagens) são compartilhadas, então
+    só um clone deve estar em uso por vez (preencher -> salvar -> próximo).
+    """
+    seguro_entre_threads = False
+
+    def __init__(self, caminho: str):
+        from docx import Document
+        self.caminho = caminho
+        self._part = Document(caminho).part
+        self._original = copy.deepcopy(self._part.element)
+
+    def clonar(self):
+        self._part._element = copy.deepcopy(self._original)
+        return self._part.document
+
+    def renderizar_adiado(self, row, datas_resolvidas, marcacoes=None, textos=None) -> bytes:
+        # O corpo clonado é reaproveitado na próxima linha: salva já, aqui mesmo
+        return self.renderizar(row, datas_resolvidas, marcacoes, textos)
+
+    def renderizar(self, row, datas_resolvidas, marcacoes=None, textos=None) -> bytes:
+        with etapa('preencher_documento'):
+            doc = preencher_documento(self.clonar(), row, datas_resolvidas, marcacoes, textos)
+        with etapa('salvar_docx'):
+            buffer = io.BytesIO()
+            doc.save(buffer)
+        return buffer.getvalue()
+
+# Placeholders {CHAVE} -> colunas
+MAPEAMENTO = {
+    'NUMERO_PROCESSO': 'NUMERO_PROCESSO',
+    'AUTOR': 'AUTOR',
+    'CUMPRIMENTO_SENTENCA': 'CUMPRIMENTO_SENTENCA',
+    'SITUACAO_PROCESSO': 'SITUACAO_PROCESSO',
+    'DATA_ACAO': 'DATA_ACAO',
+    'DATA_PERICIA': 'DATA_PERICIA',
+    'DATA_REALIZADA': 'DATA_REALIZADA',
+    'DATA_LAUDO': 'DATA_LAUDO',
+    'TIPO LAUDO': 'TIPO LAUDO',
+    'DATA_SENTENCA': 'DATA_SENTENCA',
+    'SENTENCA': 'SENTENCA',
+    'DATA_APELACAO': 'DATA_APELACAO',
+    'APE': 'APE',
+    'DATA_JULGAMENTO': 'DATA_JULGAMENTO',
+    'JULGA': 'JULGA',
+    'DATA_TRANSITO': 'DATA_TRANSITO',
+    'DATA_CUMPRIMENTO': 'DATA_CUMPRIMENTO',
+    'DATA_HOMOLOGACAO': 'DATA_HOMOLOGACAO',
+    'DATA_PRECA': 'DATA_PRECA',
+    'DATA_RPV': 'DATA_RPV',
+    'DATA_OFICIO': 'DATA_OFICIO',
+    'DATA_OR_PAGAMENTO': 'DATA_OR_PAGAMENTO',
+    'DATA_ENCERRAMENTO': 'DATA_ENCERRAMENTO'
+}
+
+# Sequências
+EVENTOS_SEQUENCIA_PRECA = [
+    ("DATA_ACAO", 0, 0, 0),
+    ("DATA_PERICIA", 0, 2, 0),
+    ("DATA_REALIZADA", 0, 1, 20),
+    ("DATA_LAUDO", 0, 2, 0),
+    ("DATA_SENTENCA", 0, 3, 0),
+    ("DATA_APELACAO", 0, 1, 15),
+    ("DATA_JULGAMENTO", 0, 2, 0),
+    ("DATA_TRANSITO", 0, 1, 0),
+    ("DATA_CUMPRIMENTO", 0, 1, 1),
+    ("DATA_HOMOLOGACAO", 0, 3, 0),
+    ("DATA_PRECA", 0, 1, 5),
+    ("DATA_OFICIO", 0, 3, 0),
+    ("DATA_OR_PAGAMENTO", 0, 1, 0),
+    ("DATA_ENCERRAMENTO", 1, 6, 0),
+]
+EVENTOS_SEQUENCIA_RPV = [
+    ("DATA_ACAO", 0, 0, 0),
+    ("DATA_PERICIA", 0, 2, 0),
+    ("DATA_REALIZADA", 0, 1, 20),
+    ("DATA_LAUDO", 0, 2, 0),
+    ("DATA_SENTENCA", 0, 3, 0),
+    ("DATA_APELACAO", 0, 1, 15),
+    ("DATA_JULGAMENTO", 0, 2, 0),
+    ("DATA_TRANSITO", 0, 1, 0),
+    ("DATA_CUMPRIMENTO", 0, 1, 1),
+    ("DATA_HOMOLOGACAO", 0, 3, 0),
+    ("DATA_RPV", 0, 1, 5),
+    ("DATA_ENCERRAMENTO", 0, 3, 9),
+]
+
+# Tipo de relatório -> sequência de eventos usada nas datas previstas
+SEQUENCIAS = {'PRECA': EVENTOS_SEQUENCIA_PRECA, 'RPV': EVENTOS_SEQUENCIA_RPV}
+
+# -------- Helpers --------
+# As mesmas datas se repetem em milhares de linhas: cada valor cru (e tipo)
+# é interpretado uma vez por execução. Limitado para não crescer sem fim
+# com planilhas enormes de datas todas diferentes.
+TAMANHO_CACHE_DATAS = 65536
+
+# Números de série do Excel (dias desde 30/12/1899) aceitos como data: 1950 a 2100
+_SERIAL_EXCEL_MIN, _SERIAL_EXCEL_MAX = 18264, 73051
+_ORIGEM_EXCEL = date(1899, 12, 30)
+
+# pandas/numpy ficam fora do import do módulo (a janela abre sem eles): as
+# etapas que recebem a planilha chamam _carregar_pandas() uma vez e os helpers
+# por célula usam estas referências, sem repetir o import a cada valor.
+# Antes do numpy carregar não existem escalares numpy, então os tipos
+# numéricos de Python bastam para _serial_excel.
+_pd = None
+_TIPOS_NUMERICOS, _TIPOS_BOOL = (int, float), (bool,)
+
+def _carregar_pandas():
+    global _pd, _TIPOS_NUMERICOS, _TIPOS_BOOL
+    if _pd is None:
+        import numpy as np
+        import pandas as pd
+        _TIPOS_NUMERICOS, _TIPOS_BOOL = (int, float, np.integer, np.floating), (bool, np.bool_)
+        _pd = pd
+
+def _serial_excel(valor):
+    if isinstance(valor, _TIPOS_NUMERICOS) and not isinstance(valor, _TIPOS_BOOL):
+        if _SERIAL_EXCEL_MIN <= valor <= _SERIAL_EXCEL_MAX:
+            return valor
+    return None
+
+def _interpretar_data(valor):
+    serial = _serial_excel(valor)
+    if serial is not None:  # célula numérica sem formato de data no Excel
+        return _ORIGEM_EXCEL + timedelta(days=int(serial))
+    if isinstance(valor, str) and _FORMATOS_TEXTO_DATA['iso'][0].fullmatch(valor):
+        # ISO é sempre ano-mês-dia; com dayfirst=True o dateutil trocaria 2020-03-05 por 3 de maio
+        try:
+            return _pd.to_datetime(valor, format='ISO8601').date()
+        except Exception:
+            pass
+    for dayfirst in (True, False):
+        try:
+            return _pd.to_datetime(valor, dayfirst=dayfirst, errors='raise').date()
+        except Exception:
+            pass
+    return None
+
+_interpretar_data_cache = functools.lru_cache(maxsize=TAMANHO_CACHE_DATAS, typed=True)(_interpretar_data)
+
+def _parse_data(valor):
+    if _pd.isna(valor) or valor in ('', None, 'None'):
+        return None
+    try:
+        return _interpretar_data_cache(valor)
+    except TypeError:  # valor não-hashable
+        return _interpretar_data(valor)
+
+def reiniciar_estatisticas_datas():
+    """Zera o cache de datas e os formatos detectados (estatísticas valem por execução)."""
+    _interpretar_data_cache.cache_clear()
+    _formatos_colunas.clear()
+
+def estatisticas_cache_datas() -> dict:
+    info = _interpretar_data_cache.cache_info()
+    consultas = info.hits + info.misses
+    return {'consultas': consultas, 'acertos': info.hits, 'interpretadas': info.misses,
+            'taxa_acerto': round(info.hits / consultas, 4) if consultas else None,
+            'tamanho': info.currsize, 'limite': info.maxsize}
+
+def _fmt_dt(dt):
+    return '' if dt is None else dt.strftime('%d/%m/%Y')
+
+def limpar_nome_arquivo(nome):
+    for ch in ['<', '>', ':', '"', '/', '\\', '|', '?', '*']:
+        nome = nome.replace(ch, '-')
+    return nome.strip() or "SEM_NUMERO"
+
+def norm(txt: str) -> str:
+    if txt is None or (isinstance(txt, float) and txt != txt):  # NaN
+        return ''
+    s = str(txt).strip().lower()
+    s = (s.replace('á', 'a').replace('à', 'a').replace('â', 'a').replace('ã', 'a')
+           .replace('é', 'e').replace('ê', 'e')
+           .replace('í', 'i')
+           .replace('ó', 'o').replace('ô', 'o').replace('õ', 'o')
+           .replace('ú', 'u')
+           .replace('ç', 'c'))
+    return s
+
+def calcular_marcacoes(linha) -> dict:
+    """Decide os checkboxes (LP/LPP/LN, SENTENCA_*, APE_*, JULGA_*) de uma linha."""
+    marcacoes = {'LP': '( )','LPP': '( )','LN': '( )','SENTENCA_A': '( )','SENTENCA_I': '( )','APE_A': '( )','APE_I': '( )','JULGA_A': '( )','JULGA_I': '( )'}
+    laudo_bruto = linha.get('TIPO LAUDO', '') or linha.get('LAUDO', '')
+    laudo_n = norm(laudo_bruto)
+    if 'positivo' in laudo_n: marcacoes['LP'] = '(X)'
+    elif 'parcial' in laudo_n: marcacoes['LPP'] = '(X)'
+    elif 'negativo' in laudo_n: marcacoes['LN'] = '(X)'
+    sentenca_bruto = linha.get('SENTENÇA', '') or linha.get('SENTENCA', '')
+    sentenca_n = norm(sentenca_bruto)
+    if 'procedente' in sentenca_n: marcacoes['SENTENCA_A'] = '(X)'
+    elif 'improcedent e' in sentenca_n: marcacoes['SENTENCA_I'] = '(X)'
+    apelacao_bruto = linha.get('APELAÇÃO', '') or linha.get('APELACAO', linha.get('APE', ''))
+    apelacao_n = norm(apelacao_bruto)
+    if 'autor' in apelacao_n: marcacoes['APE_A'] = '(X)'
+    elif 'inss' in apelacao_n: marcacoes['APE_I'] = '(X)'
+    julgamento_bruto = linha.get('JULGAMENTO', '') or linha.get('JULGA', '')
+    julgamento_n = norm(julgamento_bruto)
+    if 'favoravel' in julgamento_n: marcacoes['JULGA_A'] = '(X)'
+    elif 'desfavoravel' in julgamento_n: marcacoes['JULGA_I'] = '(X)'
+    return marcacoes
+
+def _coluna_ou(df, *nomes):
+    """Replica `linha.get(a, '') or linha.get(b, '')` para todas as linhas de uma vez."""
+    vazia = [''] * len(df)
+    resultado = df[nomes[0]].tolist() if nomes[0] in df.columns else vazia
+    for nome in nomes[1:]:
+        alternativa = df[nome].tolist() if nome in df.columns else vazia
+        resultado = [v or alt for v, alt in zip(resultado, alternativa)]
+    return resultado
+
+def _normalizar_coluna(valores):
+    """norm() aplicado uma vez por valor distinto."""
+    import pandas as pd
+    cache = {}
+    normalizados = []
+    for v in valores:
+        try:
+            n = cache[v]
+        except KeyError:
+            n = cache[v] = norm(v)
+        except TypeError:
+            n = norm(v)
+        normalizados.append(n)
+    return pd.Series(normalizados, dtype=object)
+
+def calcular_marcacoes_tabela(df) -> list:
+    """
+    Mesmo resultado de calcular_marcacoes(linha) para todas as linhas do df,
+    calculado uma vez na carga da planilha: cada coluna é normalizada por
+    valor distinto e as regras viram máscaras. Devolve um dict por linha.
+    """
+    import numpy as np
+    apelacao_alt = 'APELACAO' if 'APELACAO' in df.columns else 'APE'
+    grupos = [
+        (_coluna_ou(df, 'TIPO LAUDO', 'LAUDO'), [('positivo', 'LP'), ('parcial', 'LPP'), ('negativo', 'LN')]),
+        (_coluna_ou(df, 'SENTENÇA', 'SENTENCA'), [('procedente', 'SENTENCA_A'), ('improcedent e', 'SENTENCA_I')]),
+        (_coluna_ou(df, 'APELAÇÃO', apelacao_alt), [('autor', 'APE_A'), ('inss', 'APE_I')]),
+        (_coluna_ou(df, 'JULGAMENTO', 'JULGA'), [('favoravel', 'JULGA_A'), ('desfavoravel', 'JULGA_I')]),
+    ]
+    colunas = {}
+    for valores, regras in grupos:
+        normalizados = _normalizar_coluna(valores)
+        ja_marcado = np.zeros(len(df), dtype=bool)
+        for termo, token in regras:  # if/elif: só a primeira regra que casar marca
+            casa = normalizados.str.contains(termo, regex=False).to_numpy(dtype=bool) & ~ja_marcado
+            colunas[token] = np.where(casa, '(X)', '( )').tolist()
+            ja_marcado |= casa
+    # Poucas combinações se repetem pela planilha toda: linhas iguais dividem o mesmo dict
+    combinacoes = {}
+    return [combinacoes.get(linha) or combinacoes.setdefault(linha, dict(zip(MARCACOES, linha)))
+            for linha in zip(*(colunas[t] for t in MARCACOES))]
+
+# --- Substituição em uma única varredura ---
+# Um só padrão reconhece os checkboxes ({TOKEN}) e os placeholders {CHAVE};
+# cada trecho encontrado é trocado consultando o dicionário da linha.
+MARCACOES = ('LP', 'LPP', 'LN', 'SENTENCA_A', 'SENTENCA_I', 'APE_A', 'APE_I', 'JULGA_A', 'JULGA_I')
+_COLUNA_POR_PLACEHOLDER = {placeholder: coluna for coluna, placeholder in MAPEAMENTO.items()}
+_PADRAO_PLACEHOLDERS = re.compile(
+    r'\(\{(' + '|'.join(map(re.escape, MARCACOES)) + r')\}\)'
+    r'|\{(' + '|'.join(map(re.escape, _COLUNA_POR_PLACEHOLDER)) + r')\}'
+)
+
+# Placeholders de texto (os de data vêm de resolver_datas)
+_PLACEHOLDERS_TEXTO = {placeholder: coluna for placeholder, coluna in _COLUNA_POR_PLACEHOLDER.items()
+                       if 'DATA' not in coluna}
+
+def _texto_celula(valor) -> str:
+    if _pd.isna(valor) or valor in ('', None, 'None'):
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))  # número do processo que o Excel transformou em float
+    return str(valor)
+
+def _textos_coluna(valores) -> list:
+    """_texto_celula() aplicado uma vez por valor distinto."""
+    cache = {}
+    textos = []
+    for v in valores:
+        try:
+            t = cache[v]
+        except KeyError:
+            t = cache[v] = _texto_celula(v)
+        except TypeError:
+            t = _texto_celula(v)
+        textos.append(t)
+    return textos
+
+def _colunas_texto(df) -> list:
+    """Uma lista de textos por placeholder não-data (na ordem de _PLACEHOLDERS_TEXTO)."""
+    _carregar_pandas()
+    vazia = [''] * len(df)
+    return [_textos_coluna(df[coluna].tolist()) if coluna in df.columns else vazia
+            for coluna in _PLACEHOLDERS_TEXTO.values()]
+
+def textos_tabela(df) -> list:
+    """
+    Texto final de cada placeholder não-data para todas as linhas do df,
+    calculado uma vez na carga (vazios/'None' -> '', 12.0 -> '12').
+    Devolve um dict placeholder -> texto por linha.
+    """
+    return [dict(zip(_PLACEHOLDERS_TEXTO, linha)) for linha in zip(*_colunas_texto(df))]
+
+def valores_da_linha(row, datas_resolvidas, textos=None) -> dict:
+    """
+    Monta o dicionário placeholder -> (texto, prevista) usado na substituição.
+    `textos` é a entrada da linha em textos_tabela(); sem ele, os textos
+    saem da própria linha.
+    """
+    if textos is None:
+        _carregar_pandas()
+        textos = {placeholder: _texto_celula(row.get(coluna)) for placeholder, coluna in _PLACEHOLDERS_TEXTO.items()}
+    valores = {placeholder: (texto, False) for placeholder, texto in textos.items()}
+    for placeholder, coluna in _COLUNA_POR_PLACEHOLDER.items():
+        if placeholder not in valores:
+            info = datas_resolvidas.get(coluna, {'valor': '', 'prevista': False})
+            valores[placeholder] = (info['valor'], info['prevista'] and info['valor'] != '')
+    return valores
+
+def substituir_placeholders(texto: str, valores: dict, marcacoes: dict):
+    """Troca {CHAVE} e ({TOKEN}) em uma passada; devolve (texto, tem_prevista)."""
+    if '{' not in texto:
+        return texto, False
+    tem_prevista = False
+
+    def _trocar(m):
+        nonlocal tem_prevista
+        token, placeholder = m.group(1), m.group(2)
+        if token is not None:
+            return marcacoes[token]
+        valor, prevista = valores[placeholder]
+        tem_prevista = tem_prevista or prevista
+        return valor
+
+    return _PADRAO_PLACEHOLDERS.sub(_trocar, texto), tem_prevista
+
+def aplicar_fonte_calibri_light(run, cor_vermelha=False):
+    from docx.oxml.ns import qn
+    from docx.shared import Pt, RGBColor
+    run.font.name = 'Calibri Light'
+    run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Calibri Light')
+    run.font.size = Pt(10.5)
+    if cor_vermelha:
+        run.font.color.rgb = RGBColor(255, 0, 0)
+
+def resolver_datas(row, sequencia_eventos):
+    from dateutil.relativedelta import relativedelta
+    _carregar_pandas()
+    datas, reais = {}, []
+    for i, (col, _, _, _) in enumerate(sequencia_eventos):
+        dt = _parse_data(row.get(col))
+        if dt is not None:
+            reais.append((i, col, dt))
+    if not reais:
+        for col, _, _, _ in sequencia_eventos:
+            datas[col] = {'valor': '', 'prevista': False}
+        return datas
+    idx_anchor, _, dt_anchor = max(reais, key=lambda t: t[2])
+    for i, (col, _, _, _) in enumerate(sequencia_eventos[:idx_anchor + 1]):
+        dt = _parse_data(row.get(col))
+        datas[col] = {'valor': _fmt_dt(dt) if dt else '', 'prevista': False}
+    cursor = dt_anchor
+    for i in range(idx_anchor + 1, len(sequencia_eventos)):
+        col, anos, meses, dias = sequencia_eventos[i]
+        dt_real = _parse_data(row.get(col))
+        if dt_real:
+            datas[col] = {'valor': _fmt_dt(dt_real), 'prevista': False}
+            if dt_real > cursor: cursor = dt_real
+        else:
+            cursor = cursor + relativedelta(years=anos, months=meses, days=dias)
+            datas[col] = {'valor': _fmt_dt(cursor), 'prevista': True}
+    return datas
+
+
+# --- Resolução de datas colunar (planilha inteira de uma vez) ---
+# Formatos reconhecidos numa amostra de cada coluna DATA_*. A coluna inteira é
+# convertida com o formato escolhido numa chamada só; o que não casar (ou não
+# converter) é "fora do padrão" e passa por _parse_data, célula a célula.
+AMOSTRA_FORMATO_DATA = 200
+_FORMATOS_TEXTO_DATA = {
+    'dd/mm/aaaa': (re.compile(r'\d{1,2}/\d{1,2}/\d{4}'), '%d/%m/%Y'),
+    'iso': (re.compile(r'\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}:\d{2})?'), 'ISO8601'),
+}
+_formatos_colunas = {}  # coluna -> {'formatos': {formato: valores}, 'valores', 'fora_do_padrao'}
+
+def _vazio_data(valor) -> bool:
+    try:
+        return bool(_pd.isna(valor)) or valor in ('', 'None')
+    except (TypeError, ValueError):
+        return False
+
+def _classificar_data(valor):
+    if isinstance(valor, date):  # inclui datetime e pd.Timestamp
+        return 'datetime'
+    if isinstance(valor, str):
+        for formato, (padrao, _) in _FORMATOS_TEXTO_DATA.items():
+            if padrao.fullmatch(valor):
+                return formato
+        return None
+    if _serial_excel(valor) is not None:
+        return 'serial_excel'
+    return None
+
+def detectar_formato_data(valores) -> str:
+    """Formato mais comum entre os primeiros valores não vazios (None se nenhum reconhecido)."""
+    _carregar_pandas()
+    contagem = {}
+    amostra = 0
+    for valor in valores:
+        if _vazio_data(valor):
+            continue
+        formato = _classificar_data(valor)
+        if formato is not None:
+            contagem[formato] = contagem.get(formato, 0) + 1
+        amostra += 1
+        if amostra >= AMOSTRA_FORMATO_DATA:
+            break
+    return max(contagem, key=contagem.get) if contagem else None
+
+def _converter_no_formato(valores, formato):
+    """(máscara dos valores no formato, datas convertidas para eles) numa chamada vetorizada."""
+    import numpy as np
+    import pandas as pd
+    if formato == 'datetime':
+        mascara = np.fromiter((isinstance(v, date) for v in valores), bool, len(valores))
+        convertidas = pd.to_datetime(pd.Series(valores[mascara], dtype=object), errors='coerce')
+    elif formato == 'serial_excel':
+        mascara = np.fromiter((_serial_excel(v) is not None for v in valores), bool, len(valores))
+        dias = np.floor(valores[mascara].astype('float64'))
+        convertidas = pd.to_datetime(pd.Series(dias), unit='D', origin=pd.Timestamp(_ORIGEM_EXCEL))
+    else:
+        padrao, formato_strptime = _FORMATOS_TEXTO_DATA[formato]
+        mascara = np.fromiter((isinstance(v, str) and padrao.fullmatch(v) is not None for v in valores),
+                              bool, len(valores))
+        convertidas = pd.to_datetime(pd.Series(valores[mascara], dtype=object), format=formato_strptime,
+                                     errors='coerce')
+    # Sem passar por datetime64[ns]: anos fora de 1677–2262 estourariam em silêncio
+    return mascara, convertidas.to_numpy().astype('datetime64[D]')
+
+def _parse_coluna(serie, nome=None) -> np.ndarray:
+    """
+    Converte uma coluna DATA_* para datetime64[D]: detecta o formato numa
+    amostra, converte os valores nesse formato de uma vez e manda só os
+    fora do padrão para _parse_data (cujo cache evita repetir o trabalho).
+    """
+    import numpy as np
+    _carregar_pandas()
+    valores = serie.to_numpy(dtype=object)
+    datas = np.full(len(valores), np.datetime64('NaT'), dtype='datetime64[D]')
+    pendentes = ~np.fromiter((_vazio_data(v) for v in valores), bool, len(valores))
+    nao_vazios = int(pendentes.sum())
+    formato = detectar_formato_data(valores)
+    if formato is not None:
+        mascara, convertidas = _converter_no_formato(valores, formato)
+        datas[mascara] = convertidas
+        pendentes[mascara] = np.isnat(convertidas)  # casou o padrão mas não converteu
+    fora = np.flatnonzero(pendentes)
+    for i in fora:
+        dt = _parse_data(valores[i])
+        if dt is not None:
+            datas[i] = np.datetime64(dt, 'D')
+    if nome is not None:
+        resumo = _formatos_colunas.setdefault(nome, {'formatos': {}, 'valores': 0, 'fora_do_padrao': 0})
+        chave = formato or 'desconhecido'
+        resumo['formatos'][chave] = resumo['formatos'].get(chave, 0) + nao_vazios
+        resumo['valores'] += nao_vazios
+        resumo['fora_do_padrao'] += len(fora)
+    return datas
+
+def resumo_formatos_datas() -> dict:
+    """Por coluna DATA_*: formato escolhido (o de mais valores, se variou entre blocos) e fora do padrão."""
+    return {
+        coluna: {'formato': max(info['formatos'], key=info['formatos'].get),
+                 'valores': info['valores'], 'fora_do_padrao': info['fora_do_padrao']}
+        for coluna, info in sorted(_formatos_colunas.items())
+    }
+
+_DIAS_NAT = -2 ** 63  # NaT em datetime64[D].astype('int64')
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+
+@functools.lru_cache(maxsize=8192)
+def _texto_dia(dias: int) -> str:
+    """dd/mm/aaaa do dia `dias` (contado de 1970-01-01), igual a _fmt_dt."""
+    try:
+        return _fmt_dt(date.fromordinal(_ORDINAL_1970 + dias))
+    except (ValueError, OverflowError):  # fora dos anos 1-9999 do datetime
+        return ''
+
+class DatasLinha(Mapping):
+    """
+    coluna -> {'valor', 'prevista'} de uma linha, como resolver_datas(): o
+    texto dd/mm/aaaa só é montado para a coluna consultada (a que o modelo
+    usa), a partir do dia guardado em DatasTabela.
+    """
+    __slots__ = ('_colunas', '_dias', '_previstas')
+
+    def __init__(self, colunas, dias, previstas):
+        self._colunas, self._dias, self._previstas = colunas, dias, previstas
+
+    def __getitem__(self, coluna):
+        j = self._colunas[coluna]
+        dias = self._dias[j]
+        return {'valor': '' if dias == _DIAS_NAT else _texto_dia(dias), 'prevista': self._previstas[j]}
+
+    def get(self, coluna, padrao=None):
+        return self[coluna] if coluna in self._colunas else padrao
+
+    def __iter__(self):
+        return iter(self._colunas)
+
+    def __len__(self):
+        return len(self._colunas)
+
+class DatasTabela:
+    """
+    Datas resolvidas de um df (resolver_datas_tabela) em dois arrays linha x
+    coluna: o dia (int64, NaT = _DIAS_NAT) e se é prevista. tabela[i] é a
+    DatasLinha da i-ésima linha.
+    """
+    __slots__ = ('colunas', '_dias', '_previstas')
+
+    def __init__(self, colunas, finais, previstas):
+        self.colunas = {col: j for j, col in enumerate(colunas)}
+        self._dias = finais.astype('int64')
+        self._previstas = previstas
+
+    def __len__(self):
+        return len(self._dias)
+
+    def __getitem__(self, i):
+        return DatasLinha(self.colunas, tuple(self._dias[i].tolist()), tuple(self._previstas[i].tolist()))
+
+    def __iter__(self):
+        for i in range(len(self._dias)):
+            yield self[i]
+
+def resolver_datas_tabela(df, sequencia_eventos, convertidas=None) -> DatasTabela:
+    """
+    Mesmo resultado de resolver_datas(row, sequencia_eventos) para todas as
+    linhas do df: cada coluna é convertida uma vez, a âncora (maior data real)
+    é achada por linha com argmax e as datas previstas são calculadas coluna
+    a coluna sobre arrays. Devolve uma DatasTabela, na ordem do df; o texto
+    das datas só é formatado quando uma linha o pede.
+    `convertidas` (coluna -> datas) permite reaproveitar as colunas já
+    convertidas para a outra sequência do mesmo df.
+    """
+    import numpy as np
+    import pandas as pd
+    _carregar_pandas()
+    if convertidas is None:
+        convertidas = {}
+    n, colunas = len(df), [col for col, _, _, _ in sequencia_eventos]
+    if n == 0:
+        return DatasTabela(colunas, np.empty((0, len(colunas)), dtype='datetime64[D]'),
+                           np.zeros((0, len(colunas)), dtype=bool))
+    reais = np.full((n, len(colunas)), np.datetime64('NaT'), dtype='datetime64[D]')
+    for j, col in enumerate(colunas):
+        if col in df.columns:
+            if col not in convertidas:
+                convertidas[col] = _parse_coluna(df[col], col)
+            reais[:, j] = convertidas[col]
+    tem_real = ~np.isnat(reais)
+    possui_real = tem_real.any(axis=1)
+
+    # Âncora: maior data real; no empate vale a primeira da sequência (como max())
+    dias = np.where(tem_real, reais.astype('int64'), np.iinfo('int64').min)
+    idx_anchor = dias.argmax(axis=1)
+    cursor = reais[np.arange(n), idx_anchor]
+
+    finais = reais.copy()
+    previstas = np.zeros_like(tem_real)
+    for j, (col, anos, meses, dias_evento) in enumerate(sequencia_eventos):
+        depois_anchor = possui_real & (j > idx_anchor)
+        if not depois_anchor.any():
+            continue
+        real_j = reais[:, j]
+        com_real = depois_anchor & tem_real[:, j]
+        cursor = np.where(com_real, np.maximum(cursor, real_j), cursor)
+        sem_real = depois_anchor & ~tem_real[:, j]
+        avancado = (pd.DatetimeIndex(cursor) + pd.DateOffset(years=anos, months=meses, days=dias_evento))
+        cursor = np.where(sem_real, avancado.values.astype('datetime64[D]'), cursor)
+        finais[:, j] = np.where(sem_real, cursor, real_j)
+        previstas[:, j] = sem_real
+
+    return DatasTabela(colunas, finais, previstas)
+
+
+def carregar_modelos(modelo_preca_path: str, modelo_rpv_path: str, backend: str = 'docx'):
+    """Modelos lidos uma vez e reaproveitados em todas as linhas."""
+    classe = BACKENDS[backend]
+    return {
+        'PRECA': classe(modelo_preca_path),
+        'RPV':   classe(modelo_rpv_path),
+    }
+
+
+def determinar_modelos(row, modelos):
+    """
+    Sempre gera os dois modelos (PRECA e RPV),
+    independentemente de haver DATA_PRECA ou DATA_RPV na planilha.
+    """
+    return [
+        ('PRECA', modelos['PRECA'], EVENTOS_SEQUENCIA_PRECA),
+        ('RPV',   modelos['RPV'],   EVENTOS_SEQUENCIA_RPV),
+    ]
+
+
+def _iter_paragrafos(doc):
+    yield from doc.paragraphs
+    for table in doc.tables:
+        for row_table in table.rows:
+            for cell in row_table.cells:
+                yield from cell.paragraphs
+
+
+def preencher_documento(doc, row, datas_resolvidas, marcacoes=None, textos=None):
+    valores = valores_da_linha(row, datas_resolvidas, textos)
+    if marcacoes is None:
+        marcacoes = calcular_marcacoes(row)
+    # Parágrafos e células de tabela
+    for paragraph in _iter_paragrafos(doc):
+        texto_original = paragraph.text
+        texto_substituido, tem_prevista = substituir_placeholders(texto_original, valores, marcacoes)
+        if texto_substituido != texto_original:
+            for r in paragraph.runs: r.text = ''
+            new_run = paragraph.add_run(texto_substituido)
+            aplicar_fonte_calibri_light(new_run, cor_vermelha=tem_prevista)
+    return doc
+
+
+# --- Backend XML cru (sem o modelo de objetos do python-docx) ---
+_SENTINELA_TEXTO = '@@TEXTO_RELATORIO@@'
+_PI_PARAGRAFO = 'relatorio-paragrafo'
+_CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def _xml_escape(texto: str) -> bytes:
+    return texto.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').encode('utf-8')
+
+def _conteudo_run_xml(texto: str) -> bytes:
+    """Mesmo XML que python-docx gera em `run.text = texto` (w:t / w:tab / w:br)."""
+    if _CARACTERES_INVALIDOS_XML.search(texto):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    partes = []
+    for trecho in re.split(r'(\t|\r|\n)', texto):
+        if trecho == '\t':
+            partes.append(b'<w:tab/>')
+        elif trecho in ('\r', '\n'):
+            partes.append(b'<w:br/>')
+        elif trecho:
+            espaco = b' xml:space="preserve"' if len(trecho.strip()) < len(trecho) else b''
+            partes.append(b'<w:t' + espaco + b'>' + _xml_escape(trecho) + b'</w:t>')
+    return b''.join(partes)
+
+
+class ModeloXml:
+    """
+    Backend alternativo ao ModeloCompilado: guarda os membros do .docx como
+    bytes e monta word/document.xml por concatenação, sem python-docx por linha.
+
+    Na compilação (uma vez) o python-docx ainda é usado para achar os mesmos
+    parágrafos que preencher_documento visitaria e para gerar, em cada um, a
+    versão "limpa + run Calibri Light" com um texto sentinela. O document.xml
+    vira uma lista de trechos fixos intercalados com esses parágrafos; por linha
+    só se escolhe o original ou a versão preenchida (preta ou vermelha).
+    """
+    seguro_entre_threads = True  # só lê o que foi compilado
+
+    def __init__(self, caminho: str):
+        from docx import Document
+        from lxml import etree
+        self.caminho = caminho
+        with zipfile.ZipFile(caminho) as z:
+            self._membros = [(info, z.read(info.filename)) for info in z.infolist()]
+
+        doc = Document(caminho)
+        corpo = doc.part.element
+        vistos, paragrafos = set(), []
+        for paragraph in _iter_paragrafos(doc):
+            if id(paragraph._p) in vistos or not _PADRAO_PLACEHOLDERS.search(paragraph.text):
+                continue
+            vistos.add(id(paragraph._p))
+            paragrafos.append((paragraph, paragraph.text))
+
+        # Marca cada parágrafo com instruções de processamento para recortá-lo do XML serializado
+        for i, (paragraph, _) in enumerate(paragrafos):
+            paragraph._p.addprevious(etree.ProcessingInstruction(_PI_PARAGRAFO, str(i)))
+            paragraph._p.addnext(etree.ProcessingInstruction(_PI_PARAGRAFO, str(i)))
+
+        def _serializar():
+            xml = etree.tostring(corpo, encoding='UTF-8', standalone=True)
+            return re.split(rb'<\?' + _PI_PARAGRAFO.encode() + rb' \d+\?>', xml)
+
+        pedacos = _serializar()
+        self._fixos = pedacos[0::2]
+        self._paragrafos = [{'texto': texto, 'original': original}
+                            for (_, texto), original in zip(paragrafos, pedacos[1::2])]
+
+        # Versões preenchidas: runs esvaziadas + run nova com texto sentinela
+        for paragraph, _ in paragrafos:
+            for r in paragraph.runs: r.text = ''
+        for chave, cor_vermelha in (('normal', False), ('vermelho', True)):
+            novas = []
+            for paragraph, _ in paragrafos:
+                new_run = paragraph.add_run(_SENTINELA_TEXTO)
+                aplicar_fonte_calibri_light(new_run, cor_vermelha=cor_vermelha)
+                novas.append((paragraph, new_run))
+            pedacos = _serializar()
+            if pedacos[0::2] != self._fixos:
+                raise ValueError(f"Não foi possível compilar o modelo XML: {caminho}")
+            for info, xml in zip(self._paragrafos, pedacos[1::2]):
+                antes, depois = xml.split(b'<w:t>' + _SENTINELA_TEXTO.encode() + b'</w:t>')
+                info[chave] = (antes, depois)
+            for paragraph, new_run in novas:
+                paragraph._p.remove(new_run._r)
+
+    def renderizar(self, row, datas_resolvidas, marcacoes=None, textos=None) -> bytes:
+        return self.renderizar_adiado(row, datas_resolvidas, marcacoes, textos)()
+
+    def renderizar_adiado(self, row, datas_resolvidas, marcacoes=None, textos=None):
+        """
+        Faz a substituição agora e devolve uma função que monta (comprime) o
+        .docx depois; o gravador em segundo plano a chama fora do laço.
+        """
+        with etapa('preencher_documento'):
+            valores = valores_da_linha(row, datas_resolvidas, textos)
+            if marcacoes is None:
+                marcacoes = calcular_marcacoes(row)
+            partes = [self._fixos[0]]
+            for info, fixo in zip(self._paragrafos, self._fixos[1:]):
+                texto_substituido, tem_prevista = substituir_placeholders(info['texto'], valores, marcacoes)
+                if texto_substituido != info['texto']:
+                    antes, depois = info['vermelho' if tem_prevista else 'normal']
+                    partes += [antes, _conteudo_run_xml(texto_substituido), depois]
+                else:
+                    partes.append(info['original'])
+                partes.append(fixo)
+            document_xml = b''.join(partes)
+        return functools.partial(self._montar_docx, document_xml)
+
+    def _montar_docx(self, document_xml: bytes) -> bytes:
+        with etapa('salvar_docx'):
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+                for info, dados in self._membros:
+                    if info.filename == 'word/document.xml':
+                        dados = document_xml
+                    # writestr anota CRC/tamanhos no ZipInfo: cópia, pois várias threads montam ao mesmo tempo
+                    z.writestr(copy.copy(info), dados)
+        return buffer.getvalue()
+
+
+BACKENDS = {'docx': ModeloCompilado, 'xml': ModeloXml}
+
+
+# --- Destinos de saída ---
+# Todos expõem gravar(nome, conteudo, numero_processo) e fechar().
+# `grava_nos_workers` diz se os processos filhos podem gravar direto; se não,
+# eles devolvem os bytes e o processo principal grava (ex.: um único .zip).
+class SaidaPasta:
+    """Um .docx por relatório na pasta de saída (comportamento padrão)."""
+    grava_nos_workers = True
+    seguro_entre_threads = True
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+
+    def gravar(self, nome, conteudo: bytes, numero_processo):
+        # Grava em arquivo temporário e troca de uma vez: no modo paralelo dois
+        # processos podem gerar o mesmo nome (NUMERO_PROCESSO repetido/vazio).
+        caminho = os.path.join(self.pasta, nome)
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        try:
+            with open(temporario, 'wb') as f:
+                f.write(conteudo)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def fechar(self):
+        pass
+
+
+class SaidaMemoria:
+    """Acumula (nome, conteudo, numero_processo); usada nos workers para devolver os bytes."""
+    grava_nos_workers = True
+
+    def __init__(self):
+        self.arquivos = []
+
+    def gravar(self, nome, conteudo: bytes, numero_processo):
+        self.arquivos.append((nome, conteudo, numero_processo))
+
+    def fechar(self):
+        pass
+
+
+class SaidaZip:
+    """
+    Escreve os relatórios em streaming dentro de um .zip na pasta de saída,
+    sem arquivos intermediários. Com `limite_bytes`, abre um novo volume
+    (Relatorios_001.zip, _002, ...) quando o atual passaria do limite.
+    Cada volume termina com indice.csv (NUMERO_PROCESSO;TIPO;ARQUIVO).
+    Os .docx já são comprimidos, então vão sem nova compressão (ZIP_STORED).
+    """
+    grava_nos_workers = False
+    ARQUIVO_INDICE = 'indice.csv'
+
+    def __init__(self, pasta: str, nome_base: str = 'Relatorios', limite_bytes: int = None):
+        self.pasta = pasta
+        self.nome_base = nome_base
+        self.limite_bytes = limite_bytes
+        self.volumes = []
+        self._zip = None
+        self._indice = []
+        self._tamanho = 0
+
+    def _abrir_volume(self):
+        if self.limite_bytes:
+            nome = f'{self.nome_base}_{len(self.volumes) + 1:03d}.zip'
+        else:
+            nome = f'{self.nome_base}.zip'
+        caminho = os.path.join(self.pasta, nome)
+        self._zip = zipfile.ZipFile(caminho, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        self.volumes.append(caminho)
+        self._indice, self._tamanho = [], 0
+
+    def _fechar_volume(self):
+        texto = io.StringIO()
+        escritor = csv.writer(texto, delimiter=';', lineterminator='\n')
+        escritor.writerow(['NUMERO_PROCESSO', 'TIPO', 'ARQUIVO'])
+        escritor.writerows(self._indice)
+        self._zip.writestr(self.ARQUIVO_INDICE, texto.getvalue().encode('utf-8-sig'))
+        self._zip.close()
+        self._zip = None
+
+    def gravar(self, nome, conteudo: bytes, numero_processo):
+        if (self._zip is not None and self.limite_bytes and self._indice
+                and self._tamanho + len(conteudo) > self.limite_bytes):
+            self._fechar_volume()
+        if self._zip is None:
+            self._abrir_volume()
+        with warnings.catch_warnings():
+            # NUMERO_PROCESSO repetido: como na pasta, vale a última entrada ao extrair
+            warnings.filterwarnings('ignore', 'Duplicate name', UserWarning)
+            self._zip.writestr(nome, conteudo)
+        self._indice.append([numero_processo, nome.split('_', 1)[0], nome])
+        self._tamanho += len(conteudo)
+
+    def fechar(self):
+        if self._zip is not None:
+            self._fechar_volume()
+
+
+class GravadorAssincrono:
+    """
+    Envolve outro destino e grava em threads de fundo enquanto o laço segue
+    renderizando. Cada thread tem uma fila limitada (memória sob controle:
+    quem renderiza espera se o disco não acompanha). Um mesmo nome de arquivo
+    vai sempre para a mesma thread, então NUMERO_PROCESSO repetido continua
+    terminando com o relatório da última linha. Destinos que não aceitam
+    gravações simultâneas (o .zip) usam uma thread só.
+    `conteudo` pode ser uma função (ver renderizar_adiado), que então é
+    chamada na thread: a compressão do .docx também sai do laço principal.
+    Falhas de gravação ficam guardadas com o NUMERO_PROCESSO; coletar_falhas()
+    as devolve para o log.
+    """
+    grava_nos_workers = False
+    aceita_adiado = True
+
+    def __init__(self, destino, threads: int = 1, limite_fila: int = 64):
+        self.destino = destino
+        if not getattr(destino, 'seguro_entre_threads', False):
+            threads = 1
+        self._filas = [queue.Queue(maxsize=max(1, limite_fila // threads)) for _ in range(threads)]
+        self._falhas = []
+        self._trava = threading.Lock()
+        self._threads = [threading.Thread(target=self._gravar_fila, args=(fila,), daemon=True,
+                                          name=f'gravador-{i + 1}')
+                         for i, fila in enumerate(self._filas)]
+        for thread in self._threads:
+            thread.start()
+
+    def _gravar_fila(self, fila):
+        while True:
+            item = fila.get()
+            if item is None:
+                fila.task_done()
+                return
+            nome, conteudo, numero_processo = item
+            try:
+                if callable(conteudo):
+                    conteudo = conteudo()
+                with etapa('gravar_em_segundo_plano'):
+                    self.destino.gravar(nome, conteudo, numero_processo)
+            except Exception as e:
+                with self._trava:
+                    self._falhas.append((numero_processo, nome, e))
+            finally:
+                fila.task_done()
+
+    def gravar(self, nome, conteudo, numero_processo):
+        fila = self._filas[zlib.crc32(nome.encode('utf-8')) % len(self._filas)]
+        fila.put((nome, conteudo, numero_processo))
+
+    def sincronizar(self):
+        """Espera terminar tudo o que já foi enfileirado (ver DiarioExecucao)."""
+        for fila in self._filas:
+            fila.join()
+
+    def coletar_falhas(self) -> list:
+        """(numero_processo, nome, erro) das gravações que falharam desde a última chamada."""
+        with self._trava:
+            falhas, self._falhas = self._falhas, []
+        return falhas
+
+    def fechar(self):
+        for fila in self._filas:
+            fila.put(None)
+        for thread in self._threads:
+            thread.join()
+        self.destino.fechar()
+
+    @property
+    def volumes(self):
+        return self.destino.volumes
+
+
+def envolver_saida(destino, workers: int, gravadores: int, fila_gravacao: int = 64):
+    """
+    O destino com o GravadorAssincrono na frente, se ele ajudar. No modo
+    paralelo, destinos em que os workers gravam direto (a pasta) ficam como
+    estão: cada worker grava o seu .docx e os bytes não voltam ao processo
+    principal. O gravador fica para quem precisa de um escritor só (o .zip).
+    """
+    if gravadores <= 0 or (workers > 1 and destino.grava_nos_workers):
+        return destino
+    return GravadorAssincrono(destino, gravadores, fila_gravacao)
+
+
+# --- Linhas compactas ---
+# df.iterrows() monta uma Series por linha (convertendo tipos) e cada
+# row.get() passa pela indexação do pandas. As linhas vão para o loop como
+# tuplas só com as colunas usadas, com as posições resolvidas uma vez por bloco.
+COLUNAS_LINHA = tuple(dict.fromkeys([*MAPEAMENTO, 'LAUDO', 'SENTENÇA', 'APELAÇÃO', 'APELACAO', 'JULGAMENTO']))
+
+class LinhaPlanilha:
+    """Uma linha da planilha: tupla de valores + posições das colunas (compartilhadas no bloco)."""
+    __slots__ = ('valores', 'posicoes')
+
+    def __init__(self, valores: tuple, posicoes: dict):
+        self.valores = valores
+        self.posicoes = posicoes
+
+    def get(self, coluna, padrao=None):
+        pos = self.posicoes.get(coluna)
+        return padrao if pos is None else self.valores[pos]
+
+    def __getitem__(self, coluna):
+        return self.valores[self.posicoes[coluna]]
+
+    def __contains__(self, coluna):
+        return coluna in self.posicoes
+
+    def __repr__(self):
+        return f'LinhaPlanilha({dict(zip(self.posicoes, self.valores))!r})'
+
+
+def linhas_compactas(df, colunas=COLUNAS_LINHA):
+    """(index, LinhaPlanilha) de cada linha do df, só com as `colunas` que existirem nele."""
+    presentes = [col for col in dict.fromkeys(colunas) if col in df.columns]
+    posicoes = {col: i for i, col in enumerate(presentes)}
+    tuplas = df[presentes].itertuples(index=False, name=None) if presentes else [()] * len(df)
+    for index, valores in zip(df.index, tuplas):
+        yield index, LinhaPlanilha(valores, posicoes)
+
+
+class PlanilhaPreparada:
+    """
+    Resultado de preparar_planilha(): as colunas calculadas de uma vez e,
+    por posição no df, a entrada de cada linha
+    {'datas': {tipo: DatasLinha}, 'marcacoes': dict, 'textos': dict},
+    montada só quando pedida (no laço, uma linha de cada vez).
+    """
+    __slots__ = ('datas', 'marcacoes', 'textos')
+
+    def __init__(self, datas, marcacoes, textos):
+        self.datas, self.marcacoes, self.textos = datas, marcacoes, textos
+
+    def __len__(self):
+        return len(self.marcacoes)
+
+    def __getitem__(self, i):
+        return {'datas': {tipo: tabela[i] for tipo, tabela in self.datas.items()},
+                'marcacoes': self.marcacoes[i],
+                'textos': dict(zip(_PLACEHOLDERS_TEXTO, [coluna[i] for coluna in self.textos]))}
+
+    def __iter__(self):
+        for i in range(len(self.marcacoes)):
+            yield self[i]
+
+
+def preparar_planilha(df, sequencias=None) -> PlanilhaPreparada:
+    """
+    Tudo o que dá para calcular de uma vez na carga da planilha: datas
+    resolvidas por tipo, checkboxes e os textos dos demais placeholders,
+    guardados por coluna. Indexada (ou percorrida) na ordem do df, dá a
+    entrada de cada linha.
+    `sequencias` (tipo -> eventos) vale SEQUENCIAS se omitido.
+    """
+    sequencias = sequencias or SEQUENCIAS
+    with etapa('resolver_datas'):
+        convertidas = {}
+        datas = {tipo: resolver_datas_tabela(df, sequencia, convertidas) for tipo, sequencia in sequencias.items()}
+    with etapa('aplicar_marcacoes'):
+        marcacoes = calcular_marcacoes_tabela(df)
+    with etapa('preparar_textos'):
+        textos = _colunas_texto(df)
+    return PlanilhaPreparada(datas, marcacoes, textos)
+
+
+def numero_do_processo(index, row) -> str:
+    if 'NUMERO_PROCESSO' not in row:
+        return f'_{index+1:03d}'
+    numero = row['NUMERO_PROCESSO']
+    if isinstance(numero, float) and numero.is_integer():
+        numero = int(numero)  # mesmo texto do placeholder: 1234.0 -> 1234
+    return str(numero)
+
+
+def nome_arquivo_saida(tipo_modelo, numero_processo) -> str:
+    return f'{tipo_modelo}_{limpar_nome_arquivo(numero_processo)}.docx'
+
+
+def processar_linha(index, row, modelos, saida, preparado=None, tipos=None):
+    """
+    Gera os relatórios de uma linha e devolve (numero_processo, mensagens,
+    gerados): as mensagens de log (✓/✗) não são impressas aqui, para que o
+    modo paralelo possa exibi-las na mesma ordem do loop sequencial, e
+    `gerados` lista os arquivos salvos com sucesso.
+    `preparado` é a entrada da linha em preparar_planilha(); sem ele,
+    datas, checkboxes e textos são calculados aqui, linha a linha.
+    `tipos` restringe os modelos gerados (modo incremental); None gera todos.
+    `saida` é um destino (SaidaPasta, SaidaZip...) ou o caminho de uma pasta.
+    """
+    if isinstance(saida, str):
+        saida = SaidaPasta(saida)
+    numero_processo = numero_do_processo(index, row)
+    mensagens, gerados = [], []
+    try:
+        modelos_usar = determinar_modelos(row, modelos)
+        for tipo_modelo, modelo, sequencia in modelos_usar:
+            if tipos is not None and tipo_modelo not in tipos:
+                continue
+            if preparado is not None:
+                datas_resolvidas = preparado['datas'][tipo_modelo]
+                marcacoes, textos = preparado['marcacoes'], preparado['textos']
+            else:
+                with etapa('resolver_datas'):
+                    datas_resolvidas = resolver_datas(row, sequencia)
+                marcacoes = textos = None
+            if getattr(saida, 'aceita_adiado', False):
+                conteudo = modelo.renderizar_adiado(row, datas_resolvidas, marcacoes, textos)
+            else:
+                conteudo = modelo.renderizar(row, datas_resolvidas, marcacoes, textos)
+            nome_arquivo = nome_arquivo_saida(tipo_modelo, numero_processo)
+            with etapa('gravar'):
+                saida.gravar(nome_arquivo, conteudo, numero_processo)
+            gerados.append(nome_arquivo)
+            mensagens.append(f'  ✓ Relatório {tipo_modelo} gerado: {nome_arquivo}')
+    except Exception as e:
+        mensagens.append(f"✗ Erro ao processar processo {numero_processo}: {e}")
+    return numero_processo, mensagens, gerados
+
+
+# --- Renderização em memória (para embutir em outros programas) ---
+class Renderizador:
+    """
+    Modelos e sequências carregados uma vez; gera os relatórios em bytes,
+    sem passar pelo disco:
+
+        r = Renderizador('MODELO RELATORIO.docx', 'Conformidade  - RPV.docx')
+        conteudo = r.renderizar(linha, 'RPV')          # linha: Series ou dict
+        for nome, conteudo in r.iterar_relatorios(df):  # df ou lista de linhas
+            ...
+
+    Os caches (modelo compilado, datas já interpretadas) continuam valendo
+    entre as chamadas. Com o backend 'docx', use um Renderizador por thread
+    (ou uma trava): o clone do modelo é reaproveitado a cada relatório.
+    """
+    def __init__(self, modelo_preca_path: str, modelo_rpv_path: str, backend: str = 'docx',
+                 sequencias: dict = None):
+        self.modelos = carregar_modelos(modelo_preca_path, modelo_rpv_path, backend)
+        self.sequencias = sequencias or SEQUENCIAS
+        # sequências próprias podem usar colunas de data fora do MAPEAMENTO
+        self.colunas = COLUNAS_LINHA + tuple(col for seq in self.sequencias.values() for col, _, _, _ in seq)
+
+    @property
+    def tipos(self) -> list:
+        return list(self.modelos)
+
+    def renderizar(self, row, tipo: str = 'PRECA', preparado=None) -> bytes:
+        """
+        O .docx de um tipo para uma linha. `preparado` é a entrada da linha em
+        preparar_planilha(); sem ele, datas, checkboxes e textos são calculados aqui.
+        """
+        if preparado is None:
+            return self.modelos[tipo].renderizar(row, resolver_datas(row, self.sequencias[tipo]))
+        return self.modelos[tipo].renderizar(row, preparado['datas'][tipo], preparado['marcacoes'],
+                                             preparado['textos'])
+
+    def iterar_relatorios(self, linhas, tipos=None):
+        """
+        Gera (nome_arquivo, bytes) de cada tipo para cada linha, na ordem.
+        Um DataFrame é preparado de uma vez (datas e checkboxes colunares);
+        outras sequências de linhas (Series ou dicts), uma a uma.
+        """
+        tipos = tipos or self.tipos
+        if hasattr(linhas, 'iterrows'):
+            pares = zip(linhas_compactas(linhas, self.colunas), preparar_planilha(linhas, self.sequencias))
+        else:
+            pares = ((par, None) for par in enumerate(linhas))
+        for (index, row), preparado in pares:
+            numero_processo = numero_do_processo(index, row)
+            for tipo in tipos:
+                yield nome_arquivo_saida(tipo, numero_processo), self.renderizar(row, tipo, preparado)
+
+
+# --- Modo incremental (manifesto com impressões digitais) ---
+# Colunas que influenciam o relatório: placeholders + origens dos checkboxes.
+COLUNAS_IMPRESSAO = sorted(COLUNAS_LINHA)
+
+def _valor_canonico(valor) -> str:
+    # 12 e 12.0, NaN e None não devem mudar a impressão só pelo tipo lido
+    if valor is None or (isinstance(valor, float) and valor != valor):  # NaN
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return repr(int(valor))
+    return repr(valor)
+
+def impressao_linha(row) -> str:
+    partes = [f'{col}={_valor_canonico(row.get(col))}' for col in COLUNAS_IMPRESSAO]
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+def _hash_arquivo(caminho) -> str:
+    # Em pedaços: uma planilha grande não precisa caber na memória só para o hash
+    with open(caminho, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class ManifestoIncremental:
+    """
+    Guarda, na pasta de saída, a impressão digital (dados da linha + bytes do
+    modelo) de cada relatório gerado. pendentes() diz quais modelos de uma
+    linha precisam ser refeitos; registrar() anota os que foram gerados.
+    """
+    ARQUIVO = '.manifesto_relatorios.json'
+
+    def __init__(self, saida_dir: str, modelo_paths: dict):
+        self.saida_dir = saida_dir
+        self.caminho = os.path.join(saida_dir, self.ARQUIVO)
+        self.hash_modelos = {tipo: _hash_arquivo(p) for tipo, p in modelo_paths.items()}
+        self.arquivos = {}
+        if os.path.exists(self.caminho):
+            with open(self.caminho, encoding='utf-8') as f:
+                self.arquivos = json.load(f).get('arquivos', {})
+        self._agendados = set()
+        self.inalterados = 0
+
+    def pendentes(self, row, numero_processo):
+        """
+        Devolve (impressao, {tipo: motivo}) com os modelos a refazer; dict
+        vazio = nada mudou. Um nome de arquivo já agendado nesta execução
+        (NUMERO_PROCESSO repetido) é sempre refeito, para o arquivo final
+        continuar sendo o da última linha, como no modo normal.
+        """
+        impressao = impressao_linha(row)
+        pendentes = {}
+        for tipo, hash_modelo in self.hash_modelos.items():
+            nome = nome_arquivo_saida(tipo, numero_processo)
+            anterior = self.arquivos.get(nome)
+            if nome in self._agendados:
+                motivo = 'nome repetido'
+            elif anterior is None:
+                motivo = 'novo'
+            elif anterior['linha'] != impressao:
+                motivo = 'dados alterados'
+            elif anterior['modelo'] != hash_modelo:
+                motivo = 'modelo alterado'
+            elif not os.path.exists(os.path.join(self.saida_dir, nome)):
+                motivo = 'arquivo ausente'
+            else:
+                self.inalterados += 1
+                continue
+            pendentes[tipo] = motivo
+            self._agendados.add(nome)
+        return impressao, pendentes
+
+    def nova_rodada(self):
+        """Zera o estado de uma execução (modo observar: o manifesto fica em memória entre ciclos)."""
+        self._agendados = set()
+        self.inalterados = 0
+
+    def registrar(self, gerados, impressao):
+        for nome in gerados:
+            tipo = nome.split('_', 1)[0]
+            self.arquivos[nome] = {'linha': impressao, 'modelo': self.hash_modelos[tipo]}
+
+    def descartar(self, nomes):
+        """Esquece arquivos cuja gravação falhou, para a próxima execução refazê-los."""
+        for nome in nomes:
+            self.arquivos.pop(nome, None)
+
+    def salvar(self):
+        temporario = self.caminho + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'versao': 1, 'modelos': self.hash_modelos, 'arquivos': self.arquivos},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temporario, self.caminho)
+
+
+# --- Diário de execução (retomar uma execução interrompida) ---
+class DiarioExecucao:
+    """
+    diario_execucao.jsonl na pasta de saída: a primeira linha identifica a
+    execução (planilha e modelos, por hash) e cada linha seguinte é um par
+    (linha da planilha, modelo) cujo .docx já está gravado. As entradas
+    esperam em memória e vão para o arquivo, com fsync, a cada `intervalo`
+    segundos, depois de o gravador em segundo plano terminar os arquivos
+    delas: uma queda perde no máximo esses últimos segundos, que são refeitos.
+    Com `retomar`, lê o diário existente (recusa se a planilha ou os modelos
+    mudaram) e pendentes() pula os pares concluídos.
+    """
+    ARQUIVO = 'diario_execucao.jsonl'
+
+    def __init__(self, saida_dir: str, excel_path: str, modelos_paths: dict, retomar: bool = False,
+                 intervalo: float = 2.0):
+        self.caminho = os.path.join(saida_dir, self.ARQUIVO)
+        self.intervalo = intervalo
+        self.tipos = list(modelos_paths)
+        self.execucao = {'planilha': os.path.abspath(excel_path), 'hash_planilha': _hash_arquivo(excel_path),
+                         'modelos': {tipo: _hash_arquivo(caminho) for tipo, caminho in modelos_paths.items()}}
+        self.concluidos = {}  # index -> {tipo}
+        self.pulados = 0
+        self._pendentes = []  # (index, tipo, nome) ainda não levados ao arquivo
+        self._salvo_em = time.monotonic()
+        if retomar:
+            self._carregar()
+            self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+        else:
+            self._arquivo = open(self.caminho, 'w', encoding='utf-8')
+            self._escrever([{'execucao': self.execucao, 'inicio': datetime.now().isoformat(timespec='seconds')}])
+
+    def _carregar(self):
+        with open(self.caminho, 'rb') as f:
+            dados = f.read()
+        # Queda no meio de uma linha: descarta o pedaço, para o append continuar numa linha nova
+        completo = dados[:dados.rfind(b'\n') + 1]
+        if len(completo) != len(dados):
+            with open(self.caminho, 'r+b') as f:
+                f.truncate(len(completo))
+        linhas = [json.loads(linha) for linha in completo.decode('utf-8').splitlines() if linha.strip()]
+        if not linhas or 'execucao' not in linhas[0]:
+            raise ValueError(f"diário inválido: {self.caminho}")
+        anterior = linhas[0]['execucao']
+        if anterior['hash_planilha'] != self.execucao['hash_planilha']:
+            raise ValueError("a planilha mudou desde a execução interrompida")
+        if anterior['modelos'] != self.execucao['modelos']:
+            raise ValueError("os modelos mudaram desde a execução interrompida")
+        for entrada in linhas[1:]:
+            if 'linha' in entrada:
+                self.concluidos.setdefault(entrada['linha'], set()).add(entrada['tipo'])
+
+    def _escrever(self, entradas):
+        for entrada in entradas:
+            self._arquivo.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._salvo_em = time.monotonic()
+
+    def pendentes(self, index, tipos=None):
+        """Dos `tipos` da linha (None = todos), os que ainda não foram concluídos."""
+        concluidos = self.concluidos.get(index)
+        if not concluidos:
+            return tipos
+        restantes = [tipo for tipo in (tipos or self.tipos) if tipo not in concluidos]
+        self.pulados += len(tipos or self.tipos) - len(restantes)
+        return restantes
+
+    def registrar(self, index, gerados):
+        for nome in gerados:
+            self._pendentes.append((int(index), nome.split('_', 1)[0], nome))
+
+    def descartar(self, nomes):
+        """Gravações que falharam não entram no diário (são refeitas ao retomar)."""
+        nomes = set(nomes)
+        self._pendentes = [entrada for entrada in self._pendentes if entrada[2] not in nomes]
+
+    def vencido(self) -> bool:
+        return bool(self._pendentes) and time.monotonic() - self._salvo_em >= self.intervalo
+
+    def salvar(self):
+        """Leva ao arquivo as entradas pendentes; os .docx delas já devem estar gravados."""
+        entradas, self._pendentes = self._pendentes, []
+        self._escrever({'linha': index, 'tipo': tipo, 'arquivo': nome} for index, tipo, nome in entradas)
+
+    def fechar(self, concluido: bool):
+        self.salvar()
+        if concluido:
+            self._escrever([{'concluido': datetime.now().isoformat(timespec='seconds')}])
+        self._arquivo.close()
+
+
+def diario_interrompido(pasta: str) -> bool:
+    """Se a pasta tem um diário de uma execução que não chegou ao fim."""
+    caminho = os.path.join(pasta, DiarioExecucao.ARQUIVO)
+    try:
+        with open(caminho, 'rb') as f:
+            f.seek(max(0, os.path.getsize(caminho) - 4096))
+            return b'"concluido"' not in f.read()
+    except OSError:
+        return False
+
+
+def encontrar_execucao_interrompida(pasta_base: str, prefixo: str = 'Relatorios_'):
+    """A subpasta Relatorios_<data> mais recente com execução interrompida (ou None)."""
+    try:
+        nomes = sorted((nome for nome in os.listdir(pasta_base) if nome.startswith(prefixo)), reverse=True)
+    except OSError:
+        return None
+    for nome in nomes:
+        pasta = os.path.join(pasta_base, nome)
+        if diario_interrompido(pasta):
+            return pasta
+    return None
+
+
+# --- Cache da planilha lida (ao lado da planilha) ---
+# Ler um .xlsx grande pelo openpyxl leva minutos. O DataFrame lido fica em
+# .<planilha>.cache.pkl, na mesma pasta, com a chave da planilha (caminho,
+# tamanho, data de modificação e SHA-256); vale enquanto ela não mudar.
+# O pickle é assinado (HMAC) com uma chave do usuário: um cache que não foi
+# gravado por ele (p.ex. numa pasta de rede compartilhada) é ignorado, nunca
+# desserializado.
+VERSAO_CACHE_PLANILHA = 1
+
+def caminho_cache_planilha(excel_path: str) -> str:
+    pasta, nome = os.path.split(os.path.abspath(excel_path))
+    return os.path.join(pasta, f'.{nome}.cache.pkl')
+
+TAMANHO_CHAVE_CACHE = 32
+
+def _chave_assinatura_cache() -> bytes:
+    pasta = os.path.join(os.path.expanduser('~'), '.relatorio_conformidade')
+    caminho = os.path.join(pasta, 'chave_cache')
+    try:
+        with open(caminho, 'rb') as f:
+            chave = f.read()
+        if len(chave) == TAMANHO_CHAVE_CACHE:
+            return chave
+    except FileNotFoundError:
+        pass
+    # Ausente, vazia ou truncada (p.ex. disco cheio ao criá-la): uma nova,
+    # gravada inteira num temporário e trocada de uma vez
+    os.makedirs(pasta, exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    try:
+        descritor = os.open(temporario, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descritor, 'wb') as f:
+            f.write(os.urandom(TAMANHO_CHAVE_CACHE))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    with open(caminho, 'rb') as f:  # se outro processo trocou junto, vale a dele
+        return f.read()
+
+def _assinar_cache(cabecalho: bytes, conteudo: bytes) -> str:
+    import hmac
+    return hmac.new(_chave_assinatura_cache(), cabecalho + b'\n' + conteudo, hashlib.sha256).hexdigest()
+
+def _identificar_planilha(excel_path, info=None) -> dict:
+    info = info or os.stat(excel_path)
+    return {'caminho': os.path.abspath(excel_path), 'tamanho': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+def _ler_cache_planilha(excel_path):
+    """O DataFrame do cache, se ele ainda vale para a planilha; senão None."""
+    import hmac
+    import pickle
+    import pandas as pd
+    try:
+        with open(caminho_cache_planilha(excel_path), 'rb') as f:
+            assinatura = f.readline().strip().decode('ascii')
+            cabecalho = f.readline().rstrip(b'\n')
+            dados = json.loads(cabecalho)
+            if dados.get('versao') != VERSAO_CACHE_PLANILHA or dados.get('pandas') != pd.__version__:
+                return None
+            anterior, atual = dados['planilha'], _identificar_planilha(excel_path)
+            if (anterior['caminho'], anterior['tamanho']) != (atual['caminho'], atual['tamanho']):
+                return None
+            # Mesma data de modificação: não precisa reler a planilha. Data diferente
+            # (cópia, "salvar" sem alterar nada): decide o conteúdo.
+            renovar = anterior['mtime_ns'] != atual['mtime_ns']
+            if renovar and anterior['sha256'] != _hash_arquivo(excel_path):
+                return None
+            conteudo = f.read()
+        if not hmac.compare_digest(assinatura, _assinar_cache(cabecalho, conteudo)):
+            return None
+        df = pickle.loads(conteudo)
+    except FileNotFoundError:
+        return None
+    except Exception:  # cache truncado, de outra versão, ...: lê a planilha de novo
+        return None
+    if renovar:  # mesmo conteúdo: grava a data nova para a próxima leitura não refazer o hash
+        _gravar_cache_bytes(excel_path, conteudo, {**atual, 'sha256': anterior['sha256']})
+    return df
+
+def _gravar_cache_bytes(excel_path, conteudo: bytes, planilha: dict):
+    import pandas as pd
+    caminho = caminho_cache_planilha(excel_path)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    try:
+        cabecalho = json.dumps({'versao': VERSAO_CACHE_PLANILHA, 'pandas': pd.__version__,
+                                'planilha': planilha}).encode('utf-8')
+        with open(temporario, 'wb') as f:
+            f.write(_assinar_cache(cabecalho, conteudo).encode('ascii') + b'\n' + cabecalho + b'\n')
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o cache da planilha: {e}")
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def _gravar_cache_planilha(excel_path, df, planilha: dict):
+    import pickle
+    _gravar_cache_bytes(excel_path, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), planilha)
+
+def ler_planilha(excel_path: str, usar_cache: bool = True):
+    """
+    Primeira aba da planilha, como o pd.read_excel. Com `usar_cache`, usa o
+    cache ao lado da planilha se ele ainda valer e, se não, grava um novo.
+    Devolve (df, origem), com origem 'cache' ou 'excel'.
+    """
+    import pandas as pd
+    if not usar_cache:
+        return pd.read_excel(excel_path), 'excel'
+    df = _ler_cache_planilha(excel_path)
+    if df is not None:
+        return df, 'cache'
+    # Os mesmos bytes dão o hash e o DataFrame: se a planilha mudar durante a
+    # leitura, a chave gravada não casa com a versão nova e o cache é refeito.
+    info = os.stat(excel_path)
+    with open(excel_path, 'rb') as f:
+        dados = f.read()
+    df = pd.read_excel(io.BytesIO(dados))
+    _gravar_cache_planilha(excel_path, df, {**_identificar_planilha(excel_path, info),
+                                            'sha256': hashlib.sha256(dados).hexdigest()})
+    return df, 'excel'
+
+
+# --- Leitura em streaming (openpyxl read-only) ---
+TAMANHO_BLOCO_PADRAO = 500
+
+def _converter_celula(valor):
+    # Mesmas conversões do leitor openpyxl do pandas (vazio -> '', 12.0 -> 12)
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def _montar_bloco(cabecalho, linhas, inicio):
+    import pandas as pd
+    from pandas.io.parsers import TextParser
+    df = TextParser([cabecalho] + linhas, header=0).read()
+    df.index = pd.RangeIndex(inicio, inicio + len(df))
+    return df
+
+class _BlocosPlanilha:
+    """Os blocos de ler_planilha_em_blocos; close() fecha a planilha mesmo antes do primeiro bloco."""
+
+    def __init__(self, wb, blocos):
+        self._wb, self._blocos = wb, blocos
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._blocos)
+
+    def close(self):
+        self._blocos.close()
+        self._wb.close()
+
+def ler_planilha_em_blocos(excel_path: str, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO):
+    """
+    Lê a primeira aba com openpyxl em modo read-only, sem materializar a
+    planilha inteira. Devolve (total_estimado, blocos): `blocos` gera
+    DataFrames de até `tamanho_bloco` linhas com o mesmo tratamento do
+    pd.read_excel (cabeçalho, vazios/'None' -> NaN, índice contínuo).
+    `tamanho_bloco` também pode ser uma função, consultada a cada bloco
+    (o limite de memória encolhe os blocos já na leitura).
+    O arquivo é aberto aqui para que erros de leitura apareçam antes do loop.
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    total = ws.max_row - 1 if ws.max_row else None  # vem do <dimension>, pode ser aproximado
+    tamanho_atual = tamanho_bloco if callable(tamanho_bloco) else (lambda: tamanho_bloco)
+
+    def _blocos():
+        try:
+            linhas = ws.iter_rows(values_only=True)
+            cabecalho = [_converter_celula(v) for v in next(linhas, ())]
+            while cabecalho and cabecalho[-1] == '':
+                cabecalho.pop()
+            if not cabecalho:
+                return
+            largura = len(cabecalho)
+            bloco, vazias, inicio = [], [], 0
+            tamanho = tamanho_atual()
+            for valores in linhas:
+                linha = [_converter_celula(v) for v in valores[:largura]]
+                linha += [''] * (largura - len(linha))
+                if all(v == '' for v in linha):
+                    vazias.append(linha)  # só entra se vier algo depois (como no read_excel)
+                    continue
+                bloco += vazias + [linha]
+                vazias = []
+                if len(bloco) >= tamanho:
+                    df = _montar_bloco(cabecalho, bloco, inicio)
+                    inicio += len(df)
+                    bloco = []
+                    yield df
+                    del df  # não segura o bloco entregue enquanto monta o próximo
+                    tamanho = tamanho_atual()
+            if bloco:
+                yield _montar_bloco(cabecalho, bloco, inicio)
+        finally:
+            wb.close()
+
+    return total, _BlocosPlanilha(wb, _blocos())
+
+
+# --- Memória limitada (planilhas muito grandes) ---
+BLOCO_MINIMO = 50
+
+def limitar_blocos(blocos, tamanho_bloco: int, memoria_mb: float = None, resumo: dict = None):
+    """
+    Reparte os blocos em pedaços de até `tamanho_bloco` linhas, um de cada
+    vez: o pedaço anterior (datas, textos, relatórios) já foi liberado quando
+    o próximo é cortado. Com `memoria_mb`, mede a memória residente entre um
+    pedaço e outro; acima do limite coleta o lixo e, se não bastar, reduz o
+    pedaço pela metade (até BLOCO_MINIMO); com folga, volta a crescer.
+    `resumo` (dict) recebe os números para o relatório da execução; o
+    tamanho em vigor fica em resumo['bloco_atual'], para o leitor em
+    streaming cortar os blocos seguintes já nesse tamanho.
+    """
+    import gc
+    tamanho_bloco = max(1, int(tamanho_bloco))  # 0 nunca avançaria no df
+    resumo = {} if resumo is None else resumo
+    resumo.update(limite_mb=memoria_mb, bloco=tamanho_bloco, menor_bloco=tamanho_bloco, reducoes=0,
+                  bloco_atual=tamanho_bloco)
+    tamanho = tamanho_bloco
+    for df in blocos:
+        inicio = 0
+        while inicio < len(df):
+            parte = df.iloc[inicio:inicio + tamanho]
+            inicio += len(parte)
+            yield parte
+            del parte
+            rss = instrumentacao.rss_atual_mb() if memoria_mb else None
+            if rss is None:
+                continue
+            if rss > memoria_mb:
+                gc.collect()
+                rss = instrumentacao.rss_atual_mb()
+                if rss > memoria_mb and tamanho > BLOCO_MINIMO:
+                    tamanho = max(BLOCO_MINIMO, tamanho // 2)
+                    resumo['bloco_atual'] = tamanho
+                    resumo['menor_bloco'] = min(resumo['menor_bloco'], tamanho)
+                    resumo['reducoes'] += 1
+                    print(f"Aviso: {rss:.0f} MB em uso (limite {memoria_mb:.0f} MB); blocos de {tamanho} linhas")
+            elif rss < memoria_mb * 0.6 and tamanho < tamanho_bloco:
+                tamanho = min(tamanho_bloco, tamanho * 2)
+                resumo['bloco_atual'] = tamanho
+        del df
+
+
+# --- Modo paralelo (ProcessPool) ---
+# Cada processo filho carrega os modelos uma única vez no initializer.
+_modelos_worker = None
+
+def _inicializar_worker(modelo_preca_path, modelo_rpv_path, backend):
+    global _modelos_worker
+    _modelos_worker = carregar_modelos(modelo_preca_path, modelo_rpv_path, backend)
+    instrumentacao.ativar()
+
+def _processar_linha_worker(index, row, saida, preparado, tipos):
+    # saida=None: o destino é do processo principal; devolve os bytes gerados.
+    # Junto vai a medição da linha (tempo, etapas, pico de memória do worker).
+    memoria = SaidaMemoria() if saida is None else None
+    inicio = time.perf_counter()
+    resultado = processar_linha(index, row, _modelos_worker, saida or memoria, preparado, tipos)
+    medicao = {'segundos': time.perf_counter() - inicio,
+               'etapas': instrumentacao.atual().extrair_etapas(),
+               'pico_rss_mb': instrumentacao.pico_rss_mb()}
+    return resultado, memoria.arquivos if memoria else [], medicao
+
+
+# Os executores recebem blocos de DataFrame: a planilha inteira como bloco
+# único, ou os blocos de ler_planilha_em_blocos no modo streaming.
+def _linhas_a_processar(df, manifesto, diario=None):
+    """
+    (index, row, tipos, impressao) de cada linha do bloco; no modo
+    incremental pula as inalteradas e, ao retomar, os pares já concluídos.
+    """
+    for index, row in linhas_compactas(df):
+        tipos = impressao = None
+        if manifesto is not None:
+            impressao, pendentes = manifesto.pendentes(row, numero_do_processo(index, row))
+            if not pendentes:
+                continue
+            tipos = list(pendentes)
+        if diario is not None:
+            tipos = diario.pendentes(index, tipos)
+            if tipos == []:
+                continue
+        yield index, row, tipos, impressao
+
+
+def _filtra_linhas(manifesto, diario) -> bool:
+    return manifesto is not None or (diario is not None and bool(diario.concluidos))
+
+
+def _medir_leitura(blocos):
+    # No streaming a leitura acontece a cada bloco pedido, intercalada com o processamento
+    blocos = iter(blocos)
+    while True:
+        with etapa('leitura'):
+            df = next(blocos, None)
+        if df is None:
+            return
+        yield df
+        del df
+
+
+def _contar_erros(mensagens) -> int:
+    return sum(1 for msg in mensagens if msg.startswith('✗'))
+
+
+def _relatar_falhas_gravacao(saida, manifesto, medicao=None, diario=None):
+    """Com o gravador em segundo plano, erros de disco aparecem depois do ✓ da linha."""
+    coletar = getattr(saida, 'coletar_falhas', None)
+    falhas = coletar() if coletar is not None else []
+    if not falhas:
+        return
+    for numero_processo, nome, erro in falhas:
+        print(f"✗ Erro ao gravar {nome} do processo {numero_processo}: {erro}")
+    if manifesto is not None:
+        manifesto.descartar(nome for _, nome, _ in falhas)
+    if diario is not None:
+        diario.descartar(nome for _, nome, _ in falhas)
+    medicao = medicao or instrumentacao.atual()
+    if medicao is not None:
+        medicao.registrar_falhas_gravacao(len(falhas))
+
+
+def _salvar_diario(diario, saida, manifesto=None, medicao=None, forcar=False):
+    """Leva ao diário as linhas concluídas, depois de os arquivos delas estarem gravados."""
+    if diario is None or not (forcar or diario.vencido()):
+        return
+    sincronizar = getattr(saida, 'sincronizar', None)
+    if sincronizar is not None:
+        with etapa('gravar'):
+            sincronizar()
+    _relatar_falhas_gravacao(saida, manifesto, medicao, diario)
+    diario.salvar()
+
+
+def _executar_sequencial(blocos, total, modelos, saida, manifesto=None, medicao=None, diario=None):
+    # `medicao`: onde registrar as linhas (padrão: a instrumentação ativa)
+    medicao = medicao or instrumentacao.atual()
+    for df in blocos:
+        if not _filtra_linhas(manifesto, diario):
+            linhas, alvo = _linhas_a_processar(df, None), df
+        else:
+            # No modo incremental (ou ao retomar) só as linhas pendentes são preparadas
+            linhas = list(_linhas_a_processar(df, manifesto, diario))
+            alvo = df if len(linhas) == len(df) else df.loc[[index for index, _, _, _ in linhas]]
+        preparados = preparar_planilha(alvo)  # na mesma ordem das linhas
+        for (index, row, tipos, impressao), preparado in zip(linhas, preparados):
+            numero_processo = numero_do_processo(index, row)
+            print(f"Processando processo {index + 1}/{total}: {numero_processo}")
+            inicio = time.perf_counter()
+            _, mensagens, gerados = processar_linha(index, row, modelos, saida, preparado, tipos)
+            if medicao is not None:
+                medicao.registrar_linha(index, numero_processo, time.perf_counter() - inicio,
+                                        len(gerados), _contar_erros(mensagens))
+            for msg in mensagens:
+                print(msg)
+            if manifesto is not None:
+                manifesto.registrar(gerados, impressao)
+            if diario is not None:
+                diario.registrar(index, gerados)
+            _relatar_falhas_gravacao(saida, manifesto, medicao, diario)
+            _salvar_diario(diario, saida, manifesto, medicao)
+        # Solta o bloco antes de pedir o próximo (com limite de memória, é
+        # entre um e outro que a memória é medida)
+        del df, linhas, alvo, preparados
+
+
+def _criar_pool(workers, modelo_preca_path, modelo_rpv_path, backend):
+    # "spawn" é o único método disponível no EXE (PyInstaller/Windows);
+    # usamos o mesmo em todo lugar para o comportamento não depender do SO.
+    from concurrent.futures import ProcessPoolExecutor
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                               initializer=_inicializar_worker,
+                               initargs=(modelo_preca_path, modelo_rpv_path, backend))
+
+
+def _enviar_bloco(pool, workers, df, saida, manifesto, diario=None, nomes_gravados=None):
+    """
+    Manda as linhas do bloco para o pool e volta na hora (pool.map já
+    enfileira tudo); devolve (indices, impressoes, resultados) ou None se
+    não houver linha a processar. Os resultados vêm em _coletar_bloco.
+    Se os workers gravam direto, `nomes_gravados` (set, um por pasta de
+    saída) guarda os NUMERO_PROCESSO já enviados: uma repetição volta em
+    bytes e é gravada por _coletar_bloco, na ordem das linhas, para a
+    última linha continuar valendo.
+    """
+    linhas = list(_linhas_a_processar(df, manifesto, diario))
+    if not linhas:
+        return None
+    alvo = df if len(linhas) == len(df) else df.loc[[index for index, _, _, _ in linhas]]
+    preparados = preparar_planilha(alvo)  # na mesma ordem das linhas
+    indices, rows, tipos, impressoes = zip(*linhas)
+    chunksize = max(1, len(linhas) // (workers * 8))
+    if not saida.grava_nos_workers:
+        saidas = [None] * len(linhas)
+    else:
+        nomes_gravados = set() if nomes_gravados is None else nomes_gravados
+        saidas = []
+        for index, row in zip(indices, rows):
+            nome = limpar_nome_arquivo(numero_do_processo(index, row)).lower()  # Windows ignora maiúsculas
+            saidas.append(None if nome in nomes_gravados else saida)
+            nomes_gravados.add(nome)
+    resultados = pool.map(_processar_linha_worker, indices, rows, saidas, preparados, tipos,
+                          chunksize=chunksize)
+    return indices, impressoes, resultados
+
+
+def _coletar_bloco(enviado, total, saida, manifesto, medicao=None, diario=None):
+    """Grava/registra os resultados de _enviar_bloco, na ordem das linhas."""
+    medicao_principal = instrumentacao.atual()
+    medicao = medicao or medicao_principal
+    indices, impressoes, resultados = enviado
+    for index, impressao, (resultado, arquivos, medicao_linha) in zip(indices, impressoes, resultados):
+        numero_processo, mensagens, gerados = resultado
+        with etapa('gravar'):
+            for nome, conteudo, numero in arquivos:
+                saida.gravar(nome, conteudo, numero)
+        if medicao_principal is not None:
+            medicao_principal.mesclar_etapas(medicao_linha['etapas'])
+            medicao_principal.registrar_pico_worker(medicao_linha['pico_rss_mb'])
+        if medicao is not None:
+            medicao.registrar_linha(index, numero_processo, medicao_linha['segundos'],
+                                    len(gerados), _contar_erros(mensagens))
+        print(f"Processando processo {index + 1}/{total}: {numero_processo}")
+        for msg in mensagens:
+            print(msg)
+        if manifesto is not None:
+            manifesto.registrar(gerados, impressao)
+        if diario is not None:
+            diario.registrar(index, gerados)
+        _relatar_falhas_gravacao(saida, manifesto, medicao, diario)
+        _salvar_diario(diario, saida, manifesto, medicao)
+
+
+def _executar_paralelo(blocos, total, modelo_preca_path, modelo_rpv_path, saida, workers, backend,
+                       manifesto=None, diario=None):
+    # O bloco seguinte é lido e enviado antes de coletar o atual: os workers
+    # não esperam a leitura/preparação, e no máximo dois blocos estão em memória.
+    from collections import deque
+    em_andamento = deque()
+    nomes_gravados = set()
+    with _criar_pool(workers, modelo_preca_path, modelo_rpv_path, backend) as pool:
+        for df in blocos:
+            enviado = _enviar_bloco(pool, workers, df, saida, manifesto, diario, nomes_gravados)
+            del df  # o que os workers precisam já foi enviado
+            if enviado is not None:
+                em_andamento.append(enviado)
+            del enviado
+            if len(em_andamento) > 1:
+                _coletar_bloco(em_andamento.popleft(), total, saida, manifesto, diario=diario)
+        while em_andamento:
+            _coletar_bloco(em_andamento.popleft(), total, saida, manifesto, diario=diario)
+
+
+def _listar_pendentes(blocos, manifesto):
+    """--dry-run: só mostra o que o modo incremental regeraria."""
+    quantidade = 0
+    for df in blocos:
+        for index, row in linhas_compactas(df):
+            numero_processo = numero_do_processo(index, row)
+            _, pendentes = manifesto.pendentes(row, numero_processo)
+            for tipo, motivo in pendentes.items():
+                print(f"  → {nome_arquivo_saida(tipo, numero_processo)} ({motivo})")
+                quantidade += 1
+    print(f"\n{quantidade} relatório(s) seriam gerados; {manifesto.inalterados} inalterado(s).")
+
+
+def preencher_relatorio(excel_path: str, modelo_preca_path: str, modelo_rpv_path: str, saida_dir: str,
+                        workers: int = 1, streaming: bool = False,
+                        tamanho_bloco: int = TAMANHO_BLOCO_PADRAO, backend: str = 'docx',
+                        incremental: bool = False, dry_run: bool = False,
+                        zip_saida: bool = False, zip_limite_mb: float = None,
+                        relatorio_execucao: str = None, perfil: str = None,
+                        gravadores: int = 1, fila_gravacao: int = 64, retomar: bool = False,
+                        memoria_mb: float = None, cache_planilha: bool = True,
+                        medicao: instrumentacao.Instrumentacao = None):
+    """
+    `relatorio_execucao`: caminho do JSON com tempos por etapa, latência por
+    linha e pico de memória (padrão: execucao.json na pasta de saída).
+    `medicao`: Instrumentacao que recebe as medidas desta execução (padrão:
+    uma nova); quem chama pode ler o relatorio() dela depois.
+    `perfil`: se informado, grava ali o cProfile do processo principal.
+    `gravadores`: threads que comprimem/gravam os relatórios em segundo plano,
+    com até `fila_gravacao` documentos esperando; 0 grava no próprio laço.
+    Fora do modo .zip, o progresso vai para diario_execucao.jsonl; `retomar`
+    continua a execução interrompida nessa pasta, pulando o que ela já gravou.
+    `memoria_mb`: processa em blocos de até `tamanho_bloco` linhas (lendo em
+    streaming), encolhendo os blocos se a memória passar desse limite.
+    `cache_planilha`: fora do streaming, reaproveita a planilha já lida
+    (ver ler_planilha).
+    Devolve False se a execução nem começou (arquivo ausente, planilha ou
+    modelo ilegível); erros em linhas isoladas ficam no log e no relatório.
+    """
     # Verificar arquivos
     if not os.path.exists(excel_path):
         print(f"ERRO: Arquivo Excel não encontrado: {excel_path}")
-        return
+        return False
     if not os.path.exists(modelo_preca_path):
         print(f"ERRO: Modelo PRECA não encontrado: {modelo_preca_path}")
-        return
+        return False
     if not os.path.exists(modelo_rpv_path):
         print(f"ERRO: Modelo RPV não encontrado: {modelo_rpv_path}")
-        return
+        return False
     if not os.path.isdir(saida_dir):
         print(f"ERRO: Pasta de saída inválida: {saida_dir}")
-        return
+        return False
+    # Combinações inválidas antes de ler qualquer coisa (a leitura é o que mais demora)
+    if zip_saida and (incremental or dry_run):
+        print("ERRO: o modo incremental precisa dos .docx soltos na pasta; não use junto com --zip.")
+        return False
+    if zip_saida and retomar:
+        print("ERRO: um .zip interrompido não pode ser continuado; rode de novo sem --retomar.")
+        return False
+
+    if memoria_mb and not streaming and excel_path.lower().endswith(('.xlsx', '.xlsm')):
+        streaming = True  # a planilha inteira em memória já furaria o limite
+    if streaming and not excel_path.lower().endswith(('.xlsx', '.xlsm')):
+        print("Aviso: leitura em streaming só funciona com .xlsx/.xlsm; lendo a planilha inteira.")
+        streaming = False
 
-    # Ler Excel
+    # Daqui em diante a instrumentação é desativada em qualquer saída (inclusive
+    # nos retornos antecipados): a próxima chamada no mesmo processo (serviço,
+    # modo observar) não soma etapas a esta medição.
+    medicao = instrumentacao.ativar(medicao)
+    leitor = None
     try:
-        df = pd.read_excel(excel_path)  # usa openpyxl p/ .xlsx
-        print(f"Planilha carregada com {len(df)} processos")
-    except Exception as e:
-        print(f"Erro ao ler a planilha Excel: {e}")
-        return
+        reiniciar_estatisticas_datas()
 
-    # Placeholders {CHAVE} -> colunas
-    mapeamento = {
-        'NUMERO_PROCESSO': 'NUMERO_PROCESSO',
-        'AUTOR': 'AUTOR',
-        'CUMPRIMENTO_SENTENCA': 'CUMPRIMENTO_SENTENCA',
-        'SITUACAO_PROCESSO': 'SITUACAO_PROCESSO',
-        'DATA_ACAO': 'DATA_ACAO',
-        'DATA_PERICIA': 'DATA_PERICIA',
-        'DATA_REALIZADA': 'DATA_REALIZADA',
-        'DATA_LAUDO': 'DATA_LAUDO',
-        'TIPO LAUDO': 'TIPO LAUDO',
-        'DATA_SENTENCA': 'DATA_SENTENCA',
-        'SENTENCA': 'SENTENCA',
-        'DATA_APELACAO': 'DATA_APELACAO',
-        'APE': 'APE',
-        'DATA_JULGAMENTO': 'DATA_JULGAMENTO',
-        'JULGA': 'JULGA',
-        'DATA_TRANSITO': 'DATA_TRANSITO',
-        'DATA_CUMPRIMENTO': 'DATA_CUMPRIMENTO',
-        'DATA_HOMOLOGACAO': 'DATA_HOMOLOGACAO',
-        'DATA_PRECA': 'DATA_PRECA',
-        'DATA_RPV': 'DATA_RPV',
-        'DATA_OFICIO': 'DATA_OFICIO',
-        'DATA_OR_PAGAMENTO': 'DATA_OR_PAGAMENTO',
-        'DATA_ENCERRAMENTO': 'DATA_ENCERRAMENTO'
-    }
+        # Com limite de memória, o leitor em streaming corta os blocos no tamanho que o limitador definir
+        resumo_memoria = {'bloco_atual': tamanho_bloco} if memoria_mb else None
+        tamanho_leitura = (lambda: resumo_memoria['bloco_atual']) if memoria_mb else tamanho_bloco
 
-    # Sequências
-    EVENTOS_SEQUENCIA_PRECA = [
-        ("DATA_ACAO", 0, 0, 0),
-        ("DATA_PERICIA", 0, 2, 0),
-        ("DATA_REALIZADA", 0, 1, 20),
-        ("DATA_LAUDO", 0, 2, 0),
-        ("DATA_SENTENCA", 0, 3, 0),
-        ("DATA_APELACAO", 0, 1, 15),
-        ("DATA_JULGAMENTO", 0, 2, 0),
-        ("DATA_TRANSITO", 0, 1, 0),
-        ("DATA_CUMPRIMENTO", 0, 1, 1),
-        ("DATA_HOMOLOGACAO", 0, 3, 0),
-        ("DATA_PRECA", 0, 1, 5),
-        ("DATA_OFICIO", 0, 3, 0),
-        ("DATA_OR_PAGAMENTO", 0, 1, 0),
-        ("DATA_ENCERRAMENTO", 1, 6, 0),
-    ]
-    EVENTOS_SEQUENCIA_RPV = [
-        ("DATA_ACAO", 0, 0, 0),
-        ("DATA_PERICIA", 0, 2, 0),
-        ("DATA_REALIZADA", 0, 1, 20),
-        ("DATA_LAUDO", 0, 2, 0),
-        ("DATA_SENTENCA", 0, 3, 0),
-        ("DATA_APELACAO", 0, 1, 15),
-        ("DATA_JULGAMENTO", 0, 2, 0),
-        ("DATA_TRANSITO", 0, 1, 0),
-        ("DATA_CUMPRIMENTO", 0, 1, 1),
-        ("DATA_HOMOLOGACAO", 0, 3, 0),
-        ("DATA_RPV", 0, 1, 5),
-        ("DATA_ENCERRAMENTO", 0, 3, 9),
-    ]
+        # Ler Excel
+        try:
+            if streaming:
+                with etapa('leitura'):
+                    total, leitor = ler_planilha_em_blocos(excel_path, tamanho_leitura)
+                blocos, origem = _medir_leitura(leitor), 'streaming'
+                print(f"Planilha aberta em streaming (~{total} processos, blocos de {tamanho_bloco})")
+            else:
+                with etapa('leitura'):
+                    df, origem = ler_planilha(excel_path, cache_planilha)  # usa openpyxl p/ .xlsx
+                total, blocos = len(df), [df]
+                print(f"Planilha carregada com {len(df)} processos" + (" (cache)" if origem == 'cache' else ""))
+        except Exception as e:
+            print(f"Erro ao ler a planilha Excel: {e}")
+            return False
+        if memoria_mb:
+            blocos = limitar_blocos(blocos, tamanho_bloco, memoria_mb, resumo_memoria)
+            print(f"Memória limitada a {memoria_mb:.0f} MB (blocos de até {tamanho_bloco} linhas)")
 
-    # -------- Helpers --------
-    def _parse_data(valor):
-        if pd.isna(valor) or valor in ('', None, 'None'):
-            return None
-        for dayfirst in (True, False):
+        # Modo incremental: manifesto na própria pasta de saída
+        manifesto = None
+        if incremental or dry_run:
             try:
-                return pd.to_datetime(valor, dayfirst=dayfirst, errors='raise').date()
-            except Exception:
-                pass
-        return None
+                manifesto = ManifestoIncremental(saida_dir, {'PRECA': modelo_preca_path, 'RPV': modelo_rpv_path})
+            except Exception as e:
+                print(f"Erro ao ler o manifesto incremental: {e}")
+                return False
+            if dry_run:
+                _listar_pendentes(blocos, manifesto)
+                return True
+
+        # Modelos: lidos uma vez (no processo principal ou em cada worker)
+        try:
+            with etapa('carregar_modelos'):
+                modelos = carregar_modelos(modelo_preca_path, modelo_rpv_path, backend)
+        except Exception as e:
+            print(f"Erro ao ler os modelos Word: {e}")
+            return False
+
+        # Diário (não no .zip: um .zip interrompido fica ilegível, não há o que retomar).
+        # Só depois dos modelos: daqui até o loop não há mais retorno antecipado.
+        diario = None
+        if not zip_saida:
+            try:
+                diario = DiarioExecucao(saida_dir, excel_path,
+                                        {'PRECA': modelo_preca_path, 'RPV': modelo_rpv_path}, retomar=retomar)
+            except (OSError, ValueError) as e:
+                if retomar:
+                    print(f"ERRO: não foi possível retomar a execução em {saida_dir}: {e}")
+                    return False
+                print(f"Aviso: sem diário de execução (não será possível retomar): {e}")
 
-    def _fmt_dt(dt):
-        return '' if dt is None else dt.strftime('%d/%m/%Y')
-
-    def limpar_nome_arquivo(nome):
-        for ch in ['<', '>', ':', '"', '/', '\\', '|', '?', '*']:
-            nome = nome.replace(ch, '-')
-        return nome.strip() or "SEM_NUMERO"
-
-    def norm(txt: str) -> str:
-        if txt is None or (isinstance(txt, float) and pd.isna(txt)):
-            return ''
-        s = str(txt).strip().lower()
-        s = (s.replace('á', 'a').replace('à', 'a').replace('â', 'a').replace('ã', 'a')
-               .replace('é', 'e').replace('ê', 'e')
-               .replace('í', 'i')
-               .replace('ó', 'o').replace('ô', 'o').replace('õ', 'o')
-               .replace('ú', 'u')
-               .replace('ç', 'c'))
-        return s
-
-    def aplicar_marcacoes(texto: str, linha: pd.Series) -> str:
-        if not texto:
-            return texto
-        marcacoes = {'LP': '( )','LPP': '( )','LN': '( )','SENTENCA_A': '( )','SENTENCA_I': '( )','APE_A': '( )','APE_I': '( )','JULGA_A': '( )','JULGA_I': '( )'}
-        laudo_bruto = linha.get('TIPO LAUDO', '') or linha.get('LAUDO', '')
-        laudo_n = norm(laudo_bruto)
-        if 'positivo' in laudo_n: marcacoes['LP'] = '(X)'
-        elif 'parcial' in laudo_n: marcacoes['LPP'] = '(X)'
-        elif 'negativo' in laudo_n: marcacoes['LN'] = '(X)'
-        sentenca_bruto = linha.get('SENTENÇA', '') or linha.get('SENTENCA', '')
-        sentenca_n = norm(sentenca_bruto)
-        if 'procedente' in sentenca_n: marcacoes['SENTENCA_A'] = '(X)'
-        elif 'improcedent e' in sentenca_n: marcacoes['SENTENCA_I'] = '(X)'
-        apelacao_bruto = linha.get('APELAÇÃO', '') or linha.get('APELACAO', linha.get('APE', ''))
-        apelacao_n = norm(apelacao_bruto)
-        if 'autor' in apelacao_n: marcacoes['APE_A'] = '(X)'
-        elif 'inss' in apelacao_n: marcacoes['APE_I'] = '(X)'
-        julgamento_bruto = linha.get('JULGAMENTO', '') or linha.get('JULGA', '')
-        julgamento_n = norm(julgamento_bruto)
-        if 'favoravel' in julgamento_n: marcacoes['JULGA_A'] = '(X)'
-        elif 'desfavoravel' in julgamento_n: marcacoes['JULGA_I'] = '(X)'
-        for token, repl in marcacoes.items():
-            texto = texto.replace(f'({{{token}}})', repl)
-        return texto
-
-    def aplicar_fonte_calibri_light(run, cor_vermelha=False):
-        run.font.name = 'Calibri Light'
-        run._element.rPr.rFonts.set(qn('w:eastAsia'), 'Calibri Light')
-        run.font.size = Pt(10.5)
-        if cor_vermelha:
-            run.font.color.rgb = RGBColor(255, 0, 0)
-
-    def resolver_datas(row, sequencia_eventos):
-        datas, reais = {}, []
-        for i, (col, _, _, _) in enumerate(sequencia_eventos):
-            dt = _parse_data(row.get(col))
-            if dt is not None:
-                reais.append((i, col, dt))
-        if not reais:
-            for col, _, _, _ in sequencia_eventos:
-                datas[col] = {'valor': '', 'prevista': False}
-            return datas
-        idx_anchor, _, dt_anchor = max(reais, key=lambda t: t[2])
-        for i, (col, _, _, _) in enumerate(sequencia_eventos[:idx_anchor + 1]):
-            dt = _parse_data(row.get(col))
-            datas[col] = {'valor': _fmt_dt(dt) if dt else '', 'prevista': False}
-        cursor = dt_anchor
-        for i in range(idx_anchor + 1, len(sequencia_eventos)):
-            col, anos, meses, dias = sequencia_eventos[i]
-            dt_real = _parse_data(row.get(col))
-            if dt_real:
-                datas[col] = {'valor': _fmt_dt(dt_real), 'prevista': False}
-                if dt_real > cursor: cursor = dt_real
+        # Loop (datas e checkboxes são calculados por bloco em preparar_planilha)
+        try:
+            if zip_saida:
+                limite = int(zip_limite_mb * 1024 * 1024) if zip_limite_mb else None
+                saida = SaidaZip(saida_dir, limite_bytes=limite)
             else:
-                cursor = cursor + relativedelta(years=anos, months=meses, days=dias)
-                datas[col] = {'valor': _fmt_dt(cursor), 'prevista': True}
-        return datas
+                saida = SaidaPasta(saida_dir)
+            saida = envolver_saida(saida, workers, gravadores, fila_gravacao)
+        except Exception:
+            if diario is not None:
+                diario.fechar(False)
+            raise
 
-    
-    def determinar_modelos(row):
-        """
-        Sempre gera os dois modelos (PRECA e RPV),
-        independentemente de haver DATA_PRECA ou DATA_RPV na planilha.
-        """
-        return [
-            ('PRECA', modelo_preca_path, EVENTOS_SEQUENCIA_PRECA),
-            ('RPV',   modelo_rpv_path,   EVENTOS_SEQUENCIA_RPV),
-        ]
-
-
-    def preencher_documento(doc, row, datas_resolvidas):
-        # Parágrafos
-        for paragraph in doc.paragraphs:
-            texto_original = paragraph.text
-            texto_substituido = texto_original
-            tem_prevista = False
-            for coluna, placeholder in mapeamento.items():
-                chave = f'{{{placeholder}}}'
-                if chave in texto_substituido:
-                    if 'DATA' in coluna:
-                        info = datas_resolvidas.get(coluna, {'valor': '', 'prevista': False})
-                        texto_substituido = texto_substituido.replace(chave, info['valor'])
-                        tem_prevista = tem_prevista or (info['prevista'] and info['valor'] != '')
-                    else:
-                        valor = row.get(coluna)
-                        valor = '' if pd.isna(valor) or valor in ('', None, 'None') else str(valor)
-                        texto_substituido = texto_substituido.replace(chave, valor)
-            texto_substituido = aplicar_marcacoes(texto_substituido, row)
-            if texto_substituido != texto_original:
-                for r in paragraph.runs: r.text = ''
-                new_run = paragraph.add_run(texto_substituido)
-                aplicar_fonte_calibri_light(new_run, cor_vermelha=tem_prevista)
-
-        # Tabelas
-        for table in doc.tables:
-            for row_table in table.rows:
-                for cell in row_table.cells:
-                    for paragraph in cell.paragraphs:
-                        texto_original = paragraph.text
-                        texto_substituido = texto_original
-                        tem_prevista = False
-                        for coluna, placeholder in mapeamento.items():
-                            chave = f'{{{placeholder}}}'
-                            if chave in texto_substituido:
-                                if 'DATA' in coluna:
-                                    info = datas_resolvidas.get(coluna, {'valor': '', 'prevista': False})
-                                    texto_substituido = texto_substituido.replace(chave, info['valor'])
-                                    tem_prevista = tem_prevista or (info['prevista'] and info['valor'] != '')
-                                else:
-                                    valor = row.get(coluna)
-                                    valor = '' if pd.isna(valor) or valor in ('', None, 'None') else str(valor)
-                                    texto_substituido = texto_substituido.replace(chave, valor)
-                        texto_substituido = aplicar_marcacoes(texto_substituido, row)
-                        if texto_substituido != texto_original:
-                            for r in paragraph.runs: r.text = ''
-                            new_run = paragraph.add_run(texto_substituido)
-                            aplicar_fonte_calibri_light(new_run, cor_vermelha=tem_prevista)
-        return doc
-
-    # Loop
-    for index, row in df.iterrows():
-        numero_processo = str(row['NUMERO_PROCESSO']) if 'NUMERO_PROCESSO' in row else f'_{index+1:03d}'
-        print(f"Processando processo {index + 1}/{len(df)}: {numero_processo}")
+        perfilador = cProfile.Profile() if perfil else None
+        concluido = False
+        try:
+            if perfilador is not None:
+                perfilador.enable()
+            if workers > 1:
+                print(f"Modo paralelo: {workers} processos")
+                _executar_paralelo(blocos, total, modelo_preca_path, modelo_rpv_path, saida, workers, backend,
+                                   manifesto, diario)
+            else:
+                _executar_sequencial(blocos, total, modelos, saida, manifesto, diario=diario)
+            concluido = True
+        finally:
+            if perfilador is not None:
+                perfilador.disable()
+                perfilador.dump_stats(perfil)
+            with etapa('gravar'):
+                saida.fechar()
+            _relatar_falhas_gravacao(saida, manifesto, diario=diario)
+            if manifesto is not None:
+                manifesto.salvar()
+            if diario is not None:
+                diario.fechar(concluido)
+        medicao.extras['cache_datas'] = estatisticas_cache_datas()
+        medicao.extras['formatos_datas'] = resumo_formatos_datas()
+        if resumo_memoria is not None:
+            medicao.extras['memoria'] = resumo_memoria
+
+        caminho_relatorio = relatorio_execucao or os.path.join(saida_dir, 'execucao.json')
         try:
-            modelos_usar = determinar_modelos(row)
-            for tipo_modelo, arquivo_modelo, sequencia in modelos_usar:
-                doc = Document(arquivo_modelo)
-                datas_resolvidas = resolver_datas(row, sequencia)
-                doc = preencher_documento(doc, row, datas_resolvidas)
-                nome_arquivo_saida = f'{tipo_modelo}_{limpar_nome_arquivo(numero_processo)}.docx'
-                doc.save(os.path.join(saida_dir, nome_arquivo_saida))
-                print(f'  ✓ Relatório {tipo_modelo} gerado: {nome_arquivo_saida}')
+            dados = medicao.salvar(caminho_relatorio, planilha=excel_path, backend=backend, workers=workers,
+                                   streaming=streaming, incremental=incremental, zip=zip_saida,
+                                   gravadores=gravadores, retomada=retomar,
+                                   leitura=origem,
+                                   pulados_retomada=diario.pulados if diario is not None else 0)
+            latencia = dados['latencia_linha_ms']
+            memoria = f", pico {dados['pico_rss_mb']:.0f} MB" if dados['pico_rss_mb'] is not None else ""
+            if dados['pico_rss_workers_mb'] is not None:
+                memoria += f" + {dados['pico_rss_workers_mb']:.0f} MB por worker"
+            print(f"\n⏱ {dados['linhas']} linha(s) em {dados['duracao_s']}s "
+                  f"(p50 {latencia['p50']} ms, p95 {latencia['p95']} ms{memoria}) "
+                  f"— detalhes em {caminho_relatorio}")
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o relatório de execução: {e}")
+        if perfilador is not None:
+            print(f"🔎 Perfil gravado em {perfil} (abrir com: python -m pstats {perfil})")
+        if zip_saida:
+            for volume in saida.volumes:
+                print(f"📦 Arquivo gerado: {volume}")
+        if manifesto is not None:
+            print(f"\n{manifesto.inalterados} relatório(s) inalterado(s) foram mantidos.")
+        if diario is not None and diario.pulados:
+            print(f"\n{diario.pulados} relatório(s) já gravados pela execução interrompida foram pulados.")
+        print("\nProcessamento concluído!")
+        return True
+    finally:
+        if leitor is not None:  # streaming: fecha a planilha se saiu antes de lê-la toda
+            leitor.close()
+        instrumentacao.desativar()
+
+
+# --- Modo lote (várias planilhas/abas com o mesmo motor) ---
+EXTENSOES_PLANILHA = ('.xlsx', '.xlsm', '.xls')
+
+def _tem_curinga(texto: str) -> bool:
+    """Padrão glob: tem *, ? ou [ e não é um arquivo que existe ('Conformidade [jan].xlsx')."""
+    return not os.path.isfile(texto) and any(ch in texto for ch in '*?[')
+
+
+def _escapar_pasta_existente(padrao: str) -> str:
+    """'Dados [2024]/*.xlsx': a parte do padrão que já é uma pasta existente vale literalmente."""
+    import glob
+    pasta, resto = padrao, ''
+    while pasta and not os.path.isdir(pasta):
+        pasta, parte = os.path.split(pasta)
+        if not parte:
+            break
+        resto = os.path.join(parte, resto) if resto else parte
+    if not pasta or not os.path.isdir(pasta):
+        return padrao
+    return os.path.join(glob.escape(pasta), resto) if resto else glob.escape(pasta)
+
+
+def listar_planilhas(fonte: str) -> list:
+    """Pasta (todas as planilhas dela), padrão glob ('entrada/*.xlsx') ou um arquivo só."""
+    import glob
+    if os.path.isdir(fonte):
+        caminhos = [os.path.join(fonte, nome) for nome in os.listdir(fonte)]
+    elif _tem_curinga(fonte):
+        caminhos = glob.glob(_escapar_pasta_existente(fonte), recursive=True)
+    else:
+        caminhos = [fonte]
+    return sorted(c for c in caminhos
+                  if os.path.isfile(c) and c.lower().endswith(EXTENSOES_PLANILHA)
+                  and not os.path.basename(c).startswith('~$'))  # arquivo de trava do Excel
+
+
+def _ordenar_intercalado(caminhos) -> list:
+    """
+    Maior, menor, segundo maior, segundo menor...: enquanto os workers
+    processam uma planilha grande, a pequena seguinte já é lida e enviada,
+    e as grandes não ficam todas para o fim.
+    """
+    por_tamanho = sorted(caminhos, key=os.path.getsize, reverse=True)
+    ordem = []
+    while por_tamanho:
+        ordem.append(por_tamanho.pop(0))
+        if por_tamanho:
+            ordem.append(por_tamanho.pop())
+    return ordem
+
+
+@contextmanager
+def _medindo(medicao):
+    """Enquanto durar o bloco, as etapas e linhas vão para `medicao` (no lote, uma por planilha)."""
+    anterior = instrumentacao.atual()
+    instrumentacao.ativar(medicao)
+    try:
+        yield medicao
+    finally:
+        if anterior is None:
+            instrumentacao.desativar()
+        else:
+            instrumentacao.ativar(anterior)
+
+
+def _ler_tarefas_lote(caminhos, abas, saida_dir, usar_cache=True):
+    """
+    Uma tarefa por aba a processar: {'planilha', 'aba', 'pasta', 'df', 'erro',
+    'medicao'}. Cada planilha é aberta uma vez só; as abas são lidas à medida
+    que as tarefas são pedidas. `abas`: None = primeira aba (lida por
+    ler_planilha, com o cache se `usar_cache`), 'todas', ou lista de nomes.
+    A leitura de cada aba já entra na `medicao` da tarefa.
+    """
+    import pandas as pd
+    usadas = set()
+    for caminho in caminhos:
+        base = limpar_nome_arquivo(os.path.splitext(os.path.basename(caminho))[0])
+        nome_pasta, n = base, 2
+        while nome_pasta.lower() in usadas:  # mesmo nome em pastas diferentes
+            nome_pasta, n = f"{base}_{n}", n + 1
+        usadas.add(nome_pasta.lower())
+        pasta_planilha = os.path.join(saida_dir, nome_pasta)
+        if abas is None:
+            tarefa = {'planilha': caminho, 'aba': None, 'pasta': pasta_planilha, 'df': None, 'erro': None,
+                      'medicao': instrumentacao.Instrumentacao()}
+            try:
+                with _medindo(tarefa['medicao']), etapa('leitura'):
+                    tarefa['df'], tarefa['leitura'] = ler_planilha(caminho, usar_cache)
+            except Exception as e:
+                tarefa['erro'] = f"Erro ao ler a planilha Excel: {e}"
+            yield tarefa
+            continue
+        try:
+            with etapa('leitura'):
+                livro = pd.ExcelFile(caminho)
         except Exception as e:
-            print(f"✗ Erro ao processar processo {numero_processo}: {e}")
+            yield {'planilha': caminho, 'aba': None, 'pasta': pasta_planilha, 'df': None,
+                   'erro': f"Erro ao ler a planilha Excel: {e}", 'medicao': instrumentacao.Instrumentacao()}
+            continue
+        with livro:
+            nomes = livro.sheet_names if abas == 'todas' else list(abas)
+            for aba in nomes:
+                pasta = os.path.join(pasta_planilha, limpar_nome_arquivo(aba))
+                tarefa = {'planilha': caminho, 'aba': aba, 'pasta': pasta, 'df': None, 'erro': None,
+                          'medicao': instrumentacao.Instrumentacao(), 'leitura': 'excel'}
+                if aba not in livro.sheet_names:
+                    tarefa['erro'] = f"Aba não encontrada: {aba}"
+                else:
+                    try:
+                        with _medindo(tarefa['medicao']), etapa('leitura'):
+                            tarefa['df'] = livro.parse(aba)
+                    except Exception as e:
+                        tarefa['erro'] = f"Erro ao ler a aba {aba}: {e}"
+                yield tarefa
+
+
+def _descrever_tarefa(tarefa) -> str:
+    nome = os.path.basename(tarefa['planilha'])
+    return f"{nome} [{tarefa['aba']}]" if tarefa['aba'] is not None else nome
+
+
+def _preencher_lote_impl(tarefas, modelo_preca_path, modelo_rpv_path, modelos, workers, backend,
+                         incremental, zip_saida, zip_limite_mb, gravadores, fila_gravacao):
+    """
+    Roda as tarefas e devolve o resumo de cada uma (ver preencher_lote).
+    O que é de uma tarefa roda com a medição dela ativa (_medindo), e ela é
+    somada à medição geral do lote quando a tarefa termina.
+    """
+    geral = instrumentacao.atual()
+    modelos_paths = {'PRECA': modelo_preca_path, 'RPV': modelo_rpv_path}
+    limite_zip = int(zip_limite_mb * 1024 * 1024) if zip_limite_mb else None
+    resumos = []
+
+    def registrar(tarefa, erro):
+        resumo = {'planilha': tarefa['planilha'], 'aba': tarefa['aba'], 'pasta': tarefa['pasta'],
+                  'situacao': 'erro' if erro else 'ok'}
+        if erro:
+            print(f"✗ {_descrever_tarefa(tarefa)}: {erro}")
+            resumo['erro'] = erro
+        resumos.append(resumo)
+        return resumo
+
+    def iniciar(tarefa):
+        print(f"\n📄 {_descrever_tarefa(tarefa)}: {len(tarefa['df'])} processos → {tarefa['pasta']}")
+        os.makedirs(tarefa['pasta'], exist_ok=True)
+        tarefa['manifesto'] = ManifestoIncremental(tarefa['pasta'], modelos_paths) if incremental else None
+        saida = SaidaZip(tarefa['pasta'], limite_bytes=limite_zip) if zip_saida else SaidaPasta(tarefa['pasta'])
+        tarefa['saida'] = envolver_saida(saida, workers, gravadores, fila_gravacao)
+
+    def concluir(tarefa):
+        saida, manifesto, medicao = tarefa['saida'], tarefa['manifesto'], tarefa['medicao']
+        with etapa('gravar'):
+            saida.fechar()
+        _relatar_falhas_gravacao(saida, manifesto, medicao)
+        if manifesto is not None:
+            manifesto.salvar()
+        contexto = dict(planilha=tarefa['planilha'], aba=tarefa['aba'], backend=backend, workers=workers,
+                        incremental=incremental, zip=zip_saida, leitura=tarefa['leitura'])
+        try:
+            dados = medicao.salvar(os.path.join(tarefa['pasta'], 'execucao.json'), **contexto)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o relatório de execução: {e}")
+            dados = medicao.relatorio(**contexto)
+        if geral is not None:
+            geral.incorporar(medicao)
+        resumo = registrar(tarefa, None)
+        resumo.update(linhas=dados['linhas'], relatorios=dados['relatorios'], erros=dados['erros'],
+                      duracao_s=dados['duracao_s'])
+        if zip_saida:
+            resumo['volumes'] = list(saida.volumes)
+        if manifesto is not None:
+            resumo['inalterados'] = manifesto.inalterados
+
+    def coletar(tarefa):
+        with _medindo(tarefa['medicao']):
+            if tarefa['enviado'] is not None:
+                _coletar_bloco(tarefa['enviado'], tarefa['total'], tarefa['saida'], tarefa['manifesto'])
+            concluir(tarefa)
+
+    def preparar(tarefa):
+        if tarefa['erro'] is None:
+            try:
+                with _medindo(tarefa['medicao']):
+                    iniciar(tarefa)
+                return True
+            except Exception as e:
+                tarefa['erro'] = f"Erro ao preparar a saída: {e}"
+        registrar(tarefa, tarefa['erro'])
+        return False
+
+    if workers <= 1:
+        for tarefa in tarefas:
+            if preparar(tarefa):
+                df = tarefa.pop('df')
+                with _medindo(tarefa['medicao']):
+                    _executar_sequencial([df], len(df), modelos, tarefa['saida'], tarefa['manifesto'])
+                    concluir(tarefa)
+        return resumos
+
+    # Paralelo: um pool só para o lote todo. A tarefa seguinte é lida e
+    # enviada antes de coletar a atual, para os workers não ficarem ociosos
+    # entre uma planilha e outra (no máximo duas tarefas em andamento).
+    from collections import deque
+    em_andamento = deque()
+    with _criar_pool(workers, modelo_preca_path, modelo_rpv_path, backend) as pool:
+        for tarefa in tarefas:
+            if not preparar(tarefa):
+                continue
+            df = tarefa.pop('df')
+            tarefa['total'] = len(df)
+            with _medindo(tarefa['medicao']):
+                tarefa['enviado'] = _enviar_bloco(pool, workers, df, tarefa['saida'], tarefa['manifesto'],
+                                                  nomes_gravados=set())
+            em_andamento.append(tarefa)
+            if len(em_andamento) > 1:
+                coletar(em_andamento.popleft())
+        while em_andamento:
+            coletar(em_andamento.popleft())
+    return resumos
+
+
+def preencher_lote(fonte: str, modelo_preca_path: str, modelo_rpv_path: str, saida_dir: str,
+                   workers: int = 1, backend: str = 'docx', abas=None, incremental: bool = False,
+                   zip_saida: bool = False, zip_limite_mb: float = None,
+                   gravadores: int = 1, fila_gravacao: int = 64, cache_planilha: bool = True,
+                   relatorio_execucao: str = None, perfil: str = None):
+    """
+    Gera os relatórios de várias planilhas com os mesmos modelos carregados
+    e o mesmo pool de processos. `fonte`: pasta, padrão glob ou arquivo;
+    `abas`: None = primeira aba de cada planilha, 'todas', ou lista de nomes.
+    Cada planilha (ou aba) vai para sua subpasta, com seu execucao.json;
+    o resumo do lote vai para `relatorio_execucao` (padrão: lote.json na
+    pasta de saída). `cache_planilha` e `perfil` como em preencher_relatorio.
+    Devolve False se alguma planilha não pôde ser processada.
+    """
+    if not os.path.exists(modelo_preca_path):
+        print(f"ERRO: Modelo PRECA não encontrado: {modelo_preca_path}")
+        return False
+    if not os.path.exists(modelo_rpv_path):
+        print(f"ERRO: Modelo RPV não encontrado: {modelo_rpv_path}")
+        return False
+    if not os.path.isdir(saida_dir):
+        print(f"ERRO: Pasta de saída inválida: {saida_dir}")
+        return False
+    if zip_saida and incremental:
+        print("ERRO: o modo incremental precisa dos .docx soltos na pasta; não use junto com --zip.")
+        return False
+    caminhos = _ordenar_intercalado(listar_planilhas(fonte))
+    if not caminhos:
+        print(f"ERRO: nenhuma planilha encontrada em: {fonte}")
+        return False
+    print(f"Lote com {len(caminhos)} planilha(s)" + (f", {workers} processos" if workers > 1 else ""))
+
+    medicao = instrumentacao.ativar()
+    reiniciar_estatisticas_datas()
+    try:
+        with etapa('carregar_modelos'):
+            modelos = carregar_modelos(modelo_preca_path, modelo_rpv_path, backend)
+    except Exception as e:
+        print(f"Erro ao ler os modelos Word: {e}")
+        instrumentacao.desativar()
+        return False
+
+    perfilador = cProfile.Profile() if perfil else None
+    try:
+        if perfilador is not None:
+            perfilador.enable()
+        resumos = _preencher_lote_impl(_ler_tarefas_lote(caminhos, abas, saida_dir, cache_planilha),
+                                       modelo_preca_path, modelo_rpv_path, modelos, workers, backend,
+                                       incremental, zip_saida, zip_limite_mb, gravadores, fila_gravacao)
+    finally:
+        if perfilador is not None:
+            perfilador.disable()
+            perfilador.dump_stats(perfil)
+        instrumentacao.desativar()
+    medicao.extras['cache_datas'] = estatisticas_cache_datas()
+    medicao.extras['formatos_datas'] = resumo_formatos_datas()
+    medicao.extras['planilhas'] = resumos
+
+    caminho_relatorio = relatorio_execucao or os.path.join(saida_dir, 'lote.json')
+    try:
+        dados = medicao.salvar(caminho_relatorio, fonte=fonte, abas=abas, backend=backend, workers=workers,
+                               incremental=incremental, zip=zip_saida, gravadores=gravadores)
+        print(f"\n⏱ {len(resumos)} planilha(s), {dados['linhas']} linha(s), {dados['relatorios']} "
+              f"relatório(s) em {dados['duracao_s']}s — detalhes em {caminho_relatorio}")
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o resumo do lote: {e}")
+    if perfilador is not None:
+        print(f"🔎 Perfil gravado em {perfil} (abrir com: python -m pstats {perfil})")
+    for resumo in resumos:
+        nome = _descrever_tarefa(resumo)
+        if resumo['situacao'] == 'ok':
+            print(f"  ✓ {nome}: {resumo['relatorios']} relatório(s), {resumo['erros']} erro(s), "
+                  f"{resumo['duracao_s']}s")
+        else:
+            print(f"  ✗ {nome}: {resumo['erro']}")
     print("\nProcessamento concluído!")
+    return all(resumo['situacao'] == 'ok' for resumo in resumos)
 
 
-if __name__ == "__main__":
-    # Permite rodar como EXE interativo
-    excel = escolher_arquivo_excel()
-    if not excel:
-        print("Operação cancelada: Excel não selecionado.")
-        sys.exit(1)
+# --- Modo observar ---
+def _assinatura_arquivo(caminho):
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+def observar_planilha(excel_path: str, modelo_preca_path: str, modelo_rpv_path: str, saida_dir: str,
+                      intervalo: float = 2.0, espera: float = 1.0, backend: str = 'docx',
+                      gravadores: int = 1, fila_gravacao: int = 64, cache_planilha: bool = True):
+    """
+    Fica rodando e regera os relatórios a cada vez que a planilha é salva.
+    A planilha é verificada a cada `intervalo` segundos (data de modificação
+    e tamanho); depois de uma mudança, espera `espera` segundos sem novas
+    gravações (o Excel salva em etapas) e compara o hash do conteúdo antes
+    de ler. Modelos, manifesto incremental e cache de datas ficam carregados
+    entre um ciclo e outro: cada ciclo só lê a planilha e refaz os processos
+    cujas linhas mudaram. Mudanças nos modelos pedem reiniciar. Ctrl+C encerra.
+    """
+    for caminho, rotulo in ((excel_path, 'Arquivo Excel'), (modelo_preca_path, 'Modelo PRECA'),
+                            (modelo_rpv_path, 'Modelo RPV')):
+        if not os.path.exists(caminho):
+            print(f"ERRO: {rotulo} não encontrado: {caminho}")
+            return False
+    if not os.path.isdir(saida_dir):
+        print(f"ERRO: Pasta de saída inválida: {saida_dir}")
+        return False
+    try:
+        modelos = carregar_modelos(modelo_preca_path, modelo_rpv_path, backend)
+        manifesto = ManifestoIncremental(saida_dir, {'PRECA': modelo_preca_path, 'RPV': modelo_rpv_path})
+    except Exception as e:
+        print(f"Erro ao preparar o modo observar: {e}")
+        return False
+    reiniciar_estatisticas_datas()
+
+    def _ciclo():
+        inicio = time.perf_counter()
+        medicao = instrumentacao.ativar()
+        try:
+            with etapa('leitura'):
+                df, _ = ler_planilha(excel_path, cache_planilha)
+        except Exception as e:  # p.ex. o Excel ainda está gravando: tenta no próximo ciclo
+            print(f"Erro ao ler a planilha Excel: {e}")
+            instrumentacao.desativar()
+            return False
+        manifesto.nova_rodada()
+        saida = SaidaPasta(saida_dir)
+        if gravadores > 0:
+            saida = GravadorAssincrono(saida, gravadores, fila_gravacao)
+        try:
+            _executar_sequencial([df], len(df), modelos, saida, manifesto)
+        finally:
+            with etapa('gravar'):
+                saida.fechar()
+            _relatar_falhas_gravacao(saida, manifesto)
+            manifesto.salvar()
+            instrumentacao.desativar()
+        medicao.extras['cache_datas'] = estatisticas_cache_datas()
+        try:
+            medicao.salvar(os.path.join(saida_dir, 'execucao.json'), planilha=excel_path, backend=backend,
+                           modo='observar')
+        except OSError:
+            pass
+        print(f"🔄 {medicao.relatorios} relatório(s) gerado(s), {manifesto.inalterados} inalterado(s) "
+              f"em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return True
+
+    print(f"👀 Observando {excel_path} (Ctrl+C para sair)")
+    try:
+        # Hash antes do ciclo, como nos seguintes: uma gravação durante a
+        # leitura muda o hash e é processada na próxima verificação
+        assinatura = _assinatura_arquivo(excel_path)
+        try:
+            conteudo = _hash_arquivo(excel_path)
+        except OSError:
+            conteudo = None
+        hash_processado = conteudo if _ciclo() else None
+        while True:
+            time.sleep(intervalo)
+            atual = _assinatura_arquivo(excel_path)
+            if atual is None or atual == assinatura:
+                continue
+            # Debounce: só segue quando a planilha para de mudar
+            while True:
+                time.sleep(espera)
+                estavel = _assinatura_arquivo(excel_path)
+                if estavel == atual:
+                    break
+                atual = estavel
+            assinatura = atual
+            try:
+                conteudo = _hash_arquivo(excel_path)
+            except OSError:
+                continue
+            if conteudo == hash_processado:
+                continue
+            print(f"\n📝 Planilha alterada em {datetime.now():%H:%M:%S}")
+            if _ciclo():
+                hash_processado = conteudo
+    except KeyboardInterrupt:
+        print("\nModo observar encerrado.")
+    return True
+
+
+# --- Serviço local (um relatório por requisição) ---
+TIPO_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+class ServicoRelatorios:
+    """
+    Planilha e modelos carregados em memória para gerar um relatório por vez:
+    renderizar('PRECA', numero) -> (nome_arquivo, bytes). As linhas ficam
+    indexadas por NUMERO_PROCESSO (como no modo normal, vale a última linha
+    repetida) e também pelo nome de arquivo saneado. A planilha é recarregada
+    quando muda no disco (verificado no máximo a cada `verificar_a_cada` s);
+    se a releitura falhar (p.ex. o Excel ainda gravando), segue a anterior.
+    """
+    def __init__(self, excel_path: str, modelo_preca_path: str, modelo_rpv_path: str,
+                 backend: str = 'docx', verificar_a_cada: float = 1.0, cache_planilha: bool = True):
+        self.excel_path = excel_path
+        self.cache_planilha = cache_planilha
+        self.verificar_a_cada = verificar_a_cada
+        self.renderizador = Renderizador(modelo_preca_path, modelo_rpv_path, backend)
+        # ModeloCompilado reaproveita um único clone: uma requisição por vez em cada modelo
+        self._travas = {tipo: threading.Lock() for tipo, modelo in self.renderizador.modelos.items()
+                        if not getattr(modelo, 'seguro_entre_threads', False)}
+        self._trava_recarga = threading.Lock()
+        self._verificado_em = 0.0
+        self._estado = None  # (assinatura, {numero: (index, row, posição)}, carregada_em, preparados)
+        self._carregar(_assinatura_arquivo(excel_path))
+
+    def _carregar(self, assinatura):
+        df, _ = ler_planilha(self.excel_path, self.cache_planilha)
+        indice = {}
+        renderizador = self.renderizador
+        preparados = preparar_planilha(df, renderizador.sequencias)  # a entrada de cada linha só na requisição
+        for posicao, (index, row) in enumerate(linhas_compactas(df, renderizador.colunas)):
+            numero = numero_do_processo(index, row)
+            indice[numero] = indice[limpar_nome_arquivo(numero)] = (index, row, posicao)
+        self._estado = (assinatura, indice, datetime.now(), preparados)
+        print(f"Planilha carregada com {len(df)} processos")
+
+    def _atualizar(self):
+        agora = time.monotonic()
+        if agora - self._verificado_em < self.verificar_a_cada:
+            return
+        with self._trava_recarga:
+            if agora - self._verificado_em < self.verificar_a_cada:
+                return
+            self._verificado_em = agora
+            assinatura = _assinatura_arquivo(self.excel_path)
+            if assinatura is None or assinatura == self._estado[0]:
+                return
+            try:
+                self._carregar(assinatura)
+            except Exception as e:
+                print(f"Erro ao recarregar a planilha Excel (mantida a anterior): {e}")
 
-    outdir = escolher_pasta_saida()
-    if not outdir:
-        print("Operação cancelada: pasta de saída não selecionada.")
-        sys.exit(1)
+    def situacao(self) -> dict:
+        self._atualizar()
+        _, indice, carregada_em, _ = self._estado
+        return {'planilha': self.excel_path, 'carregada_em': carregada_em.isoformat(timespec='seconds'),
+                'processos': len({id(linha) for linha in indice.values()}), 'tipos': self.renderizador.tipos}
 
-    # Cria subpasta automática dentro da escolhida
-    data_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    pasta_final = os.path.join(outdir, f"Relatorios_{data_str}")
-    os.makedirs(pasta_final, exist_ok=True)
-    print(f"\n📁 Pasta de saída criada (ou existente): {pasta_final}\n")
+    def renderizar(self, tipo: str, numero: str):
+        """(nome_arquivo, bytes); KeyError se o tipo ou o processo não existir."""
+        self._atualizar()
+        tipo = tipo.upper()
+        if tipo not in self.renderizador.modelos:
+            raise KeyError(tipo)
+        _, indice, _, preparados = self._estado
+        index, row, posicao = indice[numero]
+        preparado = preparados[posicao]
+        trava = self._travas.get(tipo)
+        if trava is None:
+            conteudo = self.renderizador.renderizar(row, tipo, preparado)
+        else:
+            with trava:
+                conteudo = self.renderizador.renderizar(row, tipo, preparado)
+        return nome_arquivo_saida(tipo, numero_do_processo(index, row)), conteudo
 
-    modelo_preca = resource_path("MODELO RELATORIO.docx")
-    modelo_rpv   = resource_path("Conformidade  - RPV.docx")
 
-    preencher_relatorio(excel, modelo_preca, modelo_rpv, pasta_final)
+def servir_relatorios(excel_path: str, modelo_preca_path: str, modelo_rpv_path: str,
+                      porta: int = 8765, backend: str = 'docx', cache_planilha: bool = True):
+    """
+    Serviço HTTP só em 127.0.0.1 para outras ferramentas internas:
+        GET /report/<PRECA|RPV>/<NUMERO_PROCESSO>  -> o .docx
+        GET /                                      -> situação (JSON)
+    Cada requisição roda numa thread. Ctrl+C encerra.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import quote, unquote, urlsplit
 
+    try:
+        servico = ServicoRelatorios(excel_path, modelo_preca_path, modelo_rpv_path, backend,
+                                    cache_planilha=cache_planilha)
+    except Exception as e:
+        print(f"Erro ao preparar o serviço: {e}")
+        return False
+
+    class _Tratador(BaseHTTPRequestHandler):
+        def _responder(self, status, corpo: bytes, tipo_conteudo, nome_arquivo=None):
+            self.send_response(status)
+            self.send_header('Content-Type', tipo_conteudo)
+            self.send_header('Content-Length', str(len(corpo)))
+            if nome_arquivo:
+                self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(nome_arquivo)}")
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _json(self, status, dados):
+            self._responder(status, json.dumps(dados, ensure_ascii=False).encode('utf-8'),
+                            'application/json; charset=utf-8')
+
+        def do_GET(self):
+            partes = urlsplit(self.path).path.split('/', 3)  # ['', 'report', tipo, numero]
+            if partes == ['', '']:
+                return self._json(200, servico.situacao())
+            if len(partes) != 4 or partes[1] != 'report':
+                return self._json(404, {'erro': 'use /report/<PRECA|RPV>/<NUMERO_PROCESSO>'})
+            tipo, numero = unquote(partes[2]), unquote(partes[3])
+            try:
+                nome, conteudo = servico.renderizar(tipo, numero)
+            except KeyError:
+                return self._json(404, {'erro': f'tipo ou processo não encontrado: {tipo}/{numero}'})
+            except Exception as e:
+                return self._json(500, {'erro': f'Erro ao processar processo {numero}: {e}'})
+            self._responder(200, conteudo, TIPO_DOCX, nome)
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), _Tratador)
+    servidor.daemon_threads = True
+    print(f"🌐 Servindo relatórios em http://127.0.0.1:{servidor.server_address[1]}/report/<tipo>/<numero> "
+          f"(Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServiço encerrado.")
+    finally:
+        servidor.server_close()
+    return True
+
+
+# --- Linha de comando ---
+def cli():
+    """
+    Ponto de entrada do script e do EXE. Sem argumentos, pergunta a planilha
+    e a pasta de saída pelas janelas do tkinter (como sempre foi); com eles,
+    roda sem interface gráfica, p.ex. em tarefas agendadas:
+
+        python v3.py planilha.xlsx --saida /srv/relatorios --workers 0
+    """
+    import typer
+
+    app = typer.Typer(add_completion=False, help="Gera relatórios PRECA/RPV a partir da planilha.")
+
+    @app.command()
+    def gerar(
+        planilha: str = typer.Argument(None, help="planilha Excel, pasta ou padrão glob de planilhas "
+                                                  "(sem ela, abre a janela de seleção)"),
+        saida: str = typer.Option(None, "--saida", "-o",
+                                  help="pasta de saída (sem ela, abre a janela de seleção)"),
+        modelo_preca: str = typer.Option(None, help="modelo .docx PRECA (padrão: o que acompanha o programa)"),
+        modelo_rpv: str = typer.Option(None, help="modelo .docx RPV (padrão: o que acompanha o programa)"),
+        subpasta: bool = typer.Option(True, "--subpasta/--sem-subpasta",
+                                      help="cria Relatorios_<data> (ou 'Relatorios' no modo incremental) "
+                                           "dentro da pasta de saída"),
+        interface: bool = typer.Option(True, "--interface/--sem-interface",
+                                       help="--sem-interface: nunca abre janelas; falha se faltar argumento"),
+        abas: str = typer.Option(None, help="abas a processar, separadas por vírgula, ou 'todas' "
+                                            "(padrão: a primeira); cada aba vai para sua subpasta"),
+        workers: int = typer.Option(1, help="processos em paralelo (0 = todos os núcleos)"),
+        streaming: bool = typer.Option(False, "--streaming",
+                                       help="lê a planilha aos poucos (openpyxl read-only) em vez de carregá-la inteira"),
+        bloco: int = typer.Option(TAMANHO_BLOCO_PADRAO, min=1, help="linhas por bloco no modo streaming"),
+        cache: bool = typer.Option(True, "--cache/--sem-cache",
+                                   help="guarda a planilha lida em .<planilha>.cache.pkl, ao lado dela, e a "
+                                        "reaproveita enquanto ela não mudar"),
+        memoria_mb: float = typer.Option(None, help="limite de memória em MB: lê e processa em blocos de até "
+                                                    "--bloco linhas, encolhendo-os se passar do limite"),
+        backend: str = typer.Option("docx", help="docx = python-docx; xml = substituição direta no document.xml"),
+        incremental: bool = typer.Option(False, "--incremental",
+                                         help="gera só o que mudou desde a última execução"),
+        observar: bool = typer.Option(False, "--observar",
+                                      help="fica rodando e regera o que mudou a cada vez que a planilha é salva"),
+        intervalo: float = typer.Option(2.0, help="com --observar: segundos entre as verificações da planilha"),
+        servir: bool = typer.Option(False, "--servir",
+                                    help="serviço HTTP local: GET /report/<PRECA|RPV>/<NUMERO_PROCESSO> devolve o .docx"),
+        porta: int = typer.Option(8765, help="com --servir: porta em 127.0.0.1"),
+        retomar: bool = typer.Option(False, "--retomar",
+                                     help="continua a última execução interrompida (a Relatorios_<data> mais "
+                                          "recente sem fim registrado), pulando o que já foi gravado"),
+        dry_run: bool = typer.Option(False, "--dry-run",
+                                     help="com --incremental: só lista os relatórios que seriam gerados"),
+        zip_saida: bool = typer.Option(False, "--zip",
+                                       help="grava tudo em Relatorios.zip (com indice.csv) em vez de arquivos soltos"),
+        zip_max_mb: float = typer.Option(None, help="com --zip: divide em volumes de até N MB"),
+        relatorio_execucao: str = typer.Option(None, help="onde gravar o JSON com tempos da execução "
+                                                          "(padrão: execucao.json na pasta de saída)"),
+        perfil: str = typer.Option(None, help="grava um perfil cProfile do processo principal neste arquivo"),
+        gravadores: int = typer.Option(1, help="threads que gravam os relatórios em segundo plano (0 = no laço); "
+                                               "com --workers, só no .zip: na pasta cada worker grava o seu"),
+        fila_gravacao: int = typer.Option(64, help="relatórios prontos aguardando gravação, no máximo"),
+    ):
+        if backend not in BACKENDS:
+            raise typer.BadParameter(f"use um de: {', '.join(sorted(BACKENDS))}", param_hint="--backend")
+
+        # Permite rodar como EXE interativo
+        excel = planilha or (escolher_arquivo_excel() if interface else None)
+        if not excel:
+            print("Operação cancelada: Excel não selecionado." if interface
+                  else "ERRO: informe a planilha (sem interface não há janela de seleção).")
+            raise typer.Exit(1)
+
+        modelo_preca = modelo_preca or resource_path("MODELO RELATORIO.docx")
+        modelo_rpv = modelo_rpv or resource_path("Conformidade  - RPV.docx")
+        if servir:  # não grava nada: dispensa a pasta de saída
+            ok = servir_relatorios(excel, modelo_preca, modelo_rpv, porta=porta, backend=backend,
+                                   cache_planilha=cache)
+            raise typer.Exit(0 if ok else 1)
+
+        outdir = saida or (escolher_pasta_saida() if interface else None)
+        if not outdir:
+            print("Operação cancelada: pasta de saída não selecionada." if interface
+                  else "ERRO: informe a pasta de saída com --saida.")
+            raise typer.Exit(1)
+
+        # Cria subpasta automática dentro da escolhida (fixa no modo incremental,
+        # para o manifesto da execução anterior ser reaproveitado)
+        if not subpasta:
+            pasta_final = outdir
+        elif incremental or dry_run or observar:
+            pasta_final = os.path.join(outdir, "Relatorios")
+        elif retomar:
+            pasta_final = encontrar_execucao_interrompida(outdir)
+            if pasta_final is None:
+                print(f"ERRO: nenhuma execução interrompida encontrada em {outdir}.")
+                raise typer.Exit(1)
+            print(f"\n↻ Retomando a execução em {pasta_final}")
+        else:
+            data_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            pasta_final = os.path.join(outdir, f"Relatorios_{data_str}")
+        os.makedirs(pasta_final, exist_ok=True)
+        print(f"\n📁 Pasta de saída criada (ou existente): {pasta_final}\n")
+
+        # Lote: pasta ou glob de planilhas (ou várias abas), uma subpasta para cada
+        if not os.path.isfile(excel) and (os.path.isdir(excel) or _tem_curinga(excel)) or abas:
+            if observar or dry_run or streaming or retomar or memoria_mb:
+                print("Aviso: --observar, --dry-run, --streaming, --retomar e --memoria-mb não se aplicam "
+                      "ao modo lote; ignorados.")
+            lista_abas = None if not abas else ('todas' if abas.strip().lower() == 'todas'
+                                                else [a.strip() for a in abas.split(',') if a.strip()])
+            ok = preencher_lote(excel, modelo_preca, modelo_rpv, pasta_final,
+                                workers=workers or os.cpu_count() or 1, backend=backend, abas=lista_abas,
+                                incremental=incremental, zip_saida=zip_saida, zip_limite_mb=zip_max_mb,
+                                gravadores=gravadores, fila_gravacao=fila_gravacao, cache_planilha=cache,
+                                relatorio_execucao=relatorio_execucao, perfil=perfil)
+            raise typer.Exit(0 if ok else 1)
+
+        if observar:
+            if workers != 1 or zip_saida or dry_run or retomar:
+                print("Aviso: --observar roda sempre em um processo, com .docx soltos na pasta.")
+            ok = observar_planilha(excel, modelo_preca, modelo_rpv, pasta_final, intervalo=intervalo,
+                                   backend=backend, gravadores=gravadores, fila_gravacao=fila_gravacao,
+                                   cache_planilha=cache)
+            raise typer.Exit(0 if ok else 1)
+
+        ok = preencher_relatorio(excel, modelo_preca, modelo_rpv, pasta_final,
+                                 workers=workers or os.cpu_count() or 1,
+                                 streaming=streaming, tamanho_bloco=bloco, backend=backend,
+                                 incremental=incremental, dry_run=dry_run,
+                                 zip_saida=zip_saida, zip_limite_mb=zip_max_mb,
+                                 relatorio_execucao=relatorio_execucao, perfil=perfil,
+                                 gravadores=gravadores, fila_gravacao=fila_gravacao, retomar=retomar,
+                                 memoria_mb=memoria_mb, cache_planilha=cache)
+        if not ok:
+            raise typer.Exit(1)
+
+    app()
+
+
+if __name__ == "__main__":
+    # Necessário para o modo paralelo no EXE (PyInstaller + spawn)
+    multiprocessing.freeze_support()
+    cli()